@@ -0,0 +1,308 @@
+import random
+import wave
+import numpy as np
+
+# --- Modulation Settings ---
+min_pitch_factor_low = 0.7   # Closer to 1.0
+max_pitch_factor_low = 0.9   # Closer to 1.0
+min_pitch_factor_high = 1.1  # Closer to 1.0
+max_pitch_factor_high = 1.3  # Closer to 1.0
+change_probability = 0.9
+change_frequency_factor = 3
+min_pitch_change_threshold = 0.20 # Increased threshold
+robotic_factor = 0.2
+distortion_level = 0.15
+
+# --- Sample Formats ---
+# name: (bytes per sample, full-scale amplitude). int24 is unpacked into int32 arrays.
+SAMPLE_FORMATS = {
+    "int16": (2, 2 ** 15 - 1),
+    "int24": (3, 2 ** 23 - 1),
+    "int32": (4, 2 ** 31 - 1),
+    "float32": (4, 1.0),
+}
+_NUMPY_TYPES = {"int16": "<i2", "int32": "<i4", "float32": "<f4"}
+# Raw chunks don't say whether 4-byte samples are int or float; browsers capture float32
+DEFAULT_FORMAT_FOR_WIDTH = {2: "int16", 3: "int24", 4: "float32"}
+# The wave module only handles integer PCM
+WAV_FORMAT_FOR_WIDTH = {2: "int16", 3: "int24", 4: "int32"}
+
+
+def random_pitch_factor(rng=random):
+    """Draws a modulating pitch factor from either the low or the high range."""
+    if rng.random() < 0.5:
+        return rng.uniform(min_pitch_factor_low, max_pitch_factor_low)
+    return rng.uniform(min_pitch_factor_high, max_pitch_factor_high)
+
+
+def chunk_indices(length, pitch_factor):
+    """Source sample offsets that make up one modulated chunk of `length` samples."""
+    if pitch_factor > 1.0:
+        new_length = int(length / pitch_factor)
+        if new_length <= 0:
+            return np.array([], dtype=int)
+        return np.round(np.linspace(0, length - 1, new_length)).astype(int)
+    if pitch_factor < 1.0:
+        # Same as np.repeat(chunk, repeat_factor)[:length]
+        repeat_factor = int(1 / pitch_factor)
+        return np.arange(length) // repeat_factor
+    return np.arange(length)
+
+
+def playback_rate(pitch_factor):
+    """How fast a chunk's source is read for `pitch_factor`, matching chunk_indices."""
+    if pitch_factor < 1.0:
+        return 1.0 / int(1 / pitch_factor)
+    return pitch_factor
+
+
+def decode_samples(audio_bytes, channels, sample_format="int16", planar=False):
+    """
+    Unpacks PCM bytes into a (frames, channels) array.
+
+    Samples are interleaved frame by frame unless `planar`, in which case each channel's
+    samples follow the previous channel's (the layout of Web Audio buffers).
+    """
+    if sample_format not in SAMPLE_FORMATS:
+        raise ValueError(f"Unsupported sample format: {sample_format}")
+    sample_width = SAMPLE_FORMATS[sample_format][0]
+    if channels < 1 or len(audio_bytes) % (channels * sample_width):
+        raise ValueError(f"Audio is not a whole number of {channels}-channel {sample_format} frames")
+
+    if sample_format == "int24":
+        packed = np.frombuffer(audio_bytes, np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = packed[:, 0] | (packed[:, 1] << 8) | (packed[:, 2] << 16)
+        samples = (samples << 8) >> 8  # Sign-extend from 24 bits
+    else:
+        samples = np.frombuffer(audio_bytes, _NUMPY_TYPES[sample_format])
+
+    if planar:
+        return samples.reshape(channels, -1).T
+    return samples.reshape(-1, channels)
+
+
+def encode_samples(audio, sample_format="int16", planar=False):
+    """Packs a (frames, channels) array back into PCM bytes; the inverse of decode_samples."""
+    if planar:
+        audio = audio.T
+    if sample_format == "int24":
+        little_endian = np.ascontiguousarray(audio, "<i4").reshape(-1)
+        return little_endian.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    return np.ascontiguousarray(audio, _NUMPY_TYPES[sample_format]).tobytes()
+
+
+def clip_audio(audio, sample_format="int16"):
+    max_amplitude = SAMPLE_FORMATS[sample_format][1]
+    clip_threshold = max_amplitude * (1.0 - distortion_level)
+    if isinstance(max_amplitude, int):
+        clip_threshold = int(clip_threshold)
+    return np.clip(audio, -clip_threshold, clip_threshold)
+
+
+class AudioScrambler:
+    """
+    Pitch-scrambling state for one audio stream.
+
+    Every chunk may switch to a new pitch factor (every `change_frequency_factor`
+    chunks), drawn from the scrambler's own RNG, so a given seed always produces the
+    same schedule. Feeding a signal through `process_chunk` piece by piece and through
+    `process_signal` in one call gives identical output.
+
+    Audio is indexed by frame along the first axis, so (frames, channels) arrays are
+    resampled with one index map shared by every channel.
+    """
+
+    def __init__(self, seed=None, initial_factor=1.0):
+        self.rng = random.Random(seed)
+        self.chunk_counter = 0
+        self.current_pitch_factor = initial_factor
+
+    def next_pitch_factor(self):
+        if self.chunk_counter % change_frequency_factor == 0:
+            if self.rng.random() < change_probability:
+                potential_factor = random_pitch_factor(self.rng)
+                if abs(potential_factor - 1.0) >= min_pitch_change_threshold:
+                    self.current_pitch_factor = round(potential_factor / robotic_factor) * robotic_factor
+        self.chunk_counter += 1
+        return self.current_pitch_factor
+
+    def pitch_schedule(self, num_chunks):
+        return np.array([self.next_pitch_factor() for _ in range(num_chunks)])
+
+    def process_chunk(self, audio_array, sample_format="int16"):
+        pitch_factor = self.next_pitch_factor()
+        return clip_audio(audio_array[chunk_indices(len(audio_array), pitch_factor)], sample_format)
+
+    def process_signal(self, audio_array, chunk_frames, sample_format="int16"):
+        """
+        Scrambles a whole signal as if it were fed through `process_chunk` in
+        `chunk_frames` pieces, using one gather per distinct (pitch factor, chunk length).
+        """
+        total = len(audio_array)
+        if total == 0:
+            return clip_audio(audio_array, sample_format)
+
+        num_chunks = -(-total // chunk_frames)
+        factors = self.pitch_schedule(num_chunks)
+        starts = np.arange(num_chunks) * chunk_frames
+        lengths = np.minimum(chunk_frames, total - starts)
+
+        out_lengths = lengths.copy()
+        shrunk = factors > 1.0
+        out_lengths[shrunk] = (lengths[shrunk] / factors[shrunk]).astype(int)
+        out_starts = np.concatenate(([0], np.cumsum(out_lengths)[:-1]))
+
+        output = np.empty((int(out_lengths.sum()),) + audio_array.shape[1:], dtype=audio_array.dtype)
+        for pitch_factor, length in set(zip(factors.tolist(), lengths.tolist())):
+            selected = (factors == pitch_factor) & (lengths == length)
+            offsets = chunk_indices(length, pitch_factor)
+            source = (starts[selected][:, None] + offsets).ravel()
+            target = (out_starts[selected][:, None] + np.arange(len(offsets))).ravel()
+            output[target] = audio_array[source]
+
+        return clip_audio(output, sample_format)
+
+
+class StreamScrambler:
+    """
+    Continuous scrambling for live streams.
+
+    Audio arrives in pieces of any size and leaves in whole `chunk_frames` chunks with
+    the same total length. Each chunk is read from the most recent input at its pitch
+    factor's playback rate (re-reading or skipping past samples as needed, a simple
+    granular pitch shift), and crossfaded over `fade_frames` with where the previous
+    chunk would have continued, so pitch changes don't click at chunk boundaries.
+    """
+
+    def __init__(self, channels, sample_format="int16", chunk_frames=240, fade_frames=48, seed=None, initial_factor=1.0):
+        if not 0 < fade_frames <= chunk_frames:
+            raise ValueError("fade_frames must be between 1 and chunk_frames")
+        self.scrambler = AudioScrambler(seed, initial_factor)
+        self.sample_format = sample_format
+        self.chunk_frames = chunk_frames
+        self.fade_frames = fade_frames
+        self.dtype = np.dtype(_NUMPY_TYPES.get(sample_format, "<i4"))
+        self.pending = np.zeros((0, channels), self.dtype)
+        self.tail = np.zeros((fade_frames, channels), np.float32)
+        self.fade_in = np.linspace(0.0, 1.0, fade_frames, endpoint=False, dtype=np.float32)[:, None]
+        # Enough past input for the fastest playback rate the settings can produce
+        fastest_rate = max(1.0, (round(max_pitch_factor_high / robotic_factor) + 1) * robotic_factor)
+        history_frames = int(np.ceil((chunk_frames + fade_frames) * fastest_rate)) + 1
+        self.history = np.zeros((history_frames, channels), self.dtype)
+        self.steps = np.arange(chunk_frames + fade_frames)
+
+    def process(self, audio_array):
+        """Takes (frames, channels) audio and returns every complete scrambled chunk so far."""
+        self.pending = np.concatenate((self.pending, audio_array))
+        num_chunks = len(self.pending) // self.chunk_frames
+        if num_chunks == 0:
+            return self.pending[:0]
+
+        ready = num_chunks * self.chunk_frames
+        output = np.concatenate([
+            self._process_chunk(self.pending[start:start + self.chunk_frames])
+            for start in range(0, ready, self.chunk_frames)
+        ])
+        self.pending = self.pending[ready:]
+        return output
+
+    def _process_chunk(self, chunk):
+        self.history = np.concatenate((self.history[len(chunk):], chunk))
+        rate = playback_rate(self.scrambler.next_pitch_factor())
+
+        # Read chunk + fade frames ending at the newest sample; the last fade frames become
+        # the next chunk's crossfade source, which at rate 1.0 lines up exactly
+        positions = len(self.history) - 1 - np.round((self.steps[::-1]) * rate).astype(int)
+        shifted = self.history[np.maximum(positions, 0)].astype(np.float32)
+
+        output = shifted[:self.chunk_frames]
+        output[:self.fade_frames] = self.tail * (1.0 - self.fade_in) + output[:self.fade_frames] * self.fade_in
+        self.tail = shifted[self.chunk_frames:]
+
+        output = clip_audio(output, self.sample_format)
+        if self.dtype.kind == "i":
+            output = np.rint(output)
+        return output.astype(self.dtype)
+
+
+class JitterBuffer:
+    """
+    Fixed-latency FIFO between a bursty producer and a steadily paced consumer.
+
+    Nothing is released until `latency_frames` are buffered. If the consumer runs dry the
+    missing frames are filled with silence and the buffer refills to the target latency
+    (an underrun); if more than `max_frames` pile up, the oldest are dropped (an overrun).
+    """
+
+    def __init__(self, channels, dtype, latency_frames, max_frames):
+        self.latency_frames = latency_frames
+        self.max_frames = max(max_frames, latency_frames)
+        self.buffer = np.zeros((0, channels), dtype)
+        self.buffering = True
+        self.underruns = 0
+        self.overruns = 0
+
+    def push(self, audio_array):
+        self.buffer = np.concatenate((self.buffer, audio_array))
+        if len(self.buffer) > self.max_frames:
+            self.buffer = self.buffer[len(self.buffer) - self.latency_frames:]
+            self.overruns += 1
+        if self.buffering and len(self.buffer) >= self.latency_frames:
+            self.buffering = False
+
+    def pop(self, frames):
+        """Returns the next `frames` frames, or None while (re)filling to the target latency."""
+        if self.buffering:
+            return None
+        output = self.buffer[:frames]
+        self.buffer = self.buffer[frames:]
+        if len(output) < frames:
+            self.underruns += 1
+            self.buffering = True
+            silence = np.zeros((frames - len(output),) + output.shape[1:], output.dtype)
+            output = np.concatenate((output, silence))
+        return output
+
+    def stats(self):
+        return {
+            "buffered_frames": len(self.buffer),
+            "latency_frames": self.latency_frames,
+            "underruns": self.underruns,
+            "overruns": self.overruns,
+        }
+
+
+def scramble_wav(source, destination, chunk_bytes, seed=None, block_chunks=256):
+    """
+    Scrambles a WAV file block by block from `source` into `destination` (paths or file objects).
+
+    Output is the same as feeding the whole recording through a fresh AudioScrambler in
+    chunks of `chunk_bytes` bytes' worth of frames, but each block is scrambled with a
+    handful of array operations and memory stays bounded by the block size however long
+    the file is. Returns (channels, sample width, frame rate).
+    """
+    scrambler = AudioScrambler(seed)
+
+    with wave.open(source, 'rb') as wf, wave.open(destination, 'wb') as out_wf:
+        num_channels = wf.getnchannels()
+        sample_width = wf.getsampwidth()
+        frame_rate = wf.getframerate()
+        out_wf.setnchannels(num_channels)
+        out_wf.setsampwidth(sample_width)
+        out_wf.setframerate(frame_rate)
+
+        sample_format = WAV_FORMAT_FOR_WIDTH.get(sample_width)
+        if sample_format is None:
+            raise ValueError(f"Unsupported WAV sample width: {sample_width} bytes")
+
+        # Blocks hold whole chunks, so only the final block can end on a partial chunk
+        chunk_frames = max(1, chunk_bytes // (num_channels * sample_width))
+        while True:
+            frames = wf.readframes(chunk_frames * block_chunks)
+            if not frames:
+                break
+            samples = decode_samples(frames, num_channels, sample_format)
+            scrambled = scrambler.process_signal(samples, chunk_frames, sample_format)
+            out_wf.writeframes(encode_samples(scrambled, sample_format))
+
+    return num_channels, sample_width, frame_rate
@@ -1,15 +1,24 @@
 import discord
 from discord.ext import commands
+import asyncio
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 import datetime
+import cv2
+import numpy as np
 from PIL import Image  # Requires Pillow (install via: pip install pillow)
+from face_swap import FaceIndex, swap_face
 
 # SETTINGS
 TOKEN = ""  # Enter your bot token here
 TARGET_CHANNEL_ID = 1358165647946940509  # Replace with your target channel ID (as an integer)
 IMAGE_DIR = "images"
 TEMP_DIR = "temp"
+IMAGE_CACHE_SIZE = 32  # Decoded images kept in memory
+IMAGE_WORKERS = 2      # Threads for PIL work, so it never blocks the gateway loop
 
 
 # Initialize the bot with necessary intents
@@ -21,10 +30,73 @@ bot = commands.Bot(command_prefix="!", intents=intents)
 os.makedirs(IMAGE_DIR, exist_ok=True)
 os.makedirs(TEMP_DIR, exist_ok=True)
 
-# --- Helper function: Dummy face swap using a vertical half-split ---
+image_executor = ThreadPoolExecutor(IMAGE_WORKERS, thread_name_prefix="images")
+
+async def run_blocking(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(image_executor, func, *args)
+
+class ImageIndex:
+    """PNG files in a folder by lowercase name, rescanned only when the folder's mtime changes."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.mtime = None
+        self.files = {}
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        with self.lock:
+            mtime = os.stat(self.directory).st_mtime_ns
+            if mtime != self.mtime:
+                with os.scandir(self.directory) as entries:
+                    self.files = {entry.name.lower(): entry.name for entry in entries
+                                  if entry.is_file() and entry.name.lower().endswith(".png")}
+                self.mtime = mtime
+            return self.files
+
+    def path(self, filename):
+        """Full path of `filename` (any case), or None if it isn't in the folder."""
+        name = self.refresh().get(filename.lower())
+        return os.path.join(self.directory, name) if name else None
+
+class ImageCache:
+    """LRU cache of decoded RGB images, keyed by path, file mtime and requested size."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.images = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path, size=None):
+        # The mtime in the key means an overwritten file is decoded again
+        key = (path, os.stat(path).st_mtime_ns, size)
+        with self.lock:
+            image = self.images.get(key)
+            if image is not None:
+                self.images.move_to_end(key)
+                return image
+
+        if size is None:
+            with Image.open(path) as source:
+                image = source.convert("RGB")
+        else:
+            image = self.get(path).resize(size)
+
+        with self.lock:
+            self.images[key] = image
+            while len(self.images) > self.capacity:
+                self.images.popitem(last=False)
+        return image
+
+image_index = ImageIndex(IMAGE_DIR)
+image_cache = ImageCache(IMAGE_CACHE_SIZE)
+face_index = FaceIndex(IMAGE_DIR)
+
+# --- Helper function: Fallback face swap using a vertical half-split ---
 def swap_faces(image1, image2):
     # Resize image2 to match image1's size
-    image2 = image2.resize(image1.size)
+    if image2.size != image1.size:
+        image2 = image2.resize(image1.size)
     w, h = image1.size
     # Create a new image by taking the left half from image2 and the right half from image1
     swapped = Image.new('RGB', (w, h))
@@ -32,10 +104,48 @@ def swap_faces(image1, image2):
     swapped.paste(image1.crop((w // 2, 0, w, h)), (w // 2, 0))
     return swapped
 
+def render_swap(path1, path2):
+    """
+    Puts the face from the second image onto the first and returns PNG bytes (runs on
+    the image executor). Landmarks come from the face index, so only images it hasn't
+    seen yet are detected here; without landmarks it falls back to the half-split.
+    """
+    image1 = image_cache.get(path1)
+    try:
+        points1, points2 = face_index.landmarks(path1), face_index.landmarks(path2)
+    except (ImportError, RuntimeError) as e:
+        print("Landmarks unavailable:", e)
+        points1 = points2 = None
+
+    if points1 is None or points2 is None:
+        buffer = BytesIO()
+        swap_faces(image1, image_cache.get(path2, image1.size)).save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    target = cv2.cvtColor(np.asarray(image1), cv2.COLOR_RGB2BGR)
+    source = cv2.cvtColor(np.asarray(image_cache.get(path2)), cv2.COLOR_RGB2BGR)
+    _, encoded = cv2.imencode(".png", swap_face(target, source, points1, points2))
+    return encoded.tobytes()
+
+def index_faces():
+    try:
+        found = face_index.update_all()
+        print(f"Face index ready: {found} faces")
+    except (ImportError, RuntimeError) as e:
+        print("Face index not built:", e)
+
+def write_file(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
 # --- !list command: List all PNG images in the images folder (names without extension) ---
 @bot.command(name="list")
 async def list_images(ctx):
-    files = [f for f in os.listdir(IMAGE_DIR) if f.endswith(".png")]
+    files = sorted((await run_blocking(image_index.refresh)).values())
     if files:
         available = [os.path.splitext(f)[0] for f in files]
         await ctx.send("Available images: " + ", ".join(available))
@@ -66,39 +176,35 @@ async def swap(ctx, first: str, second: str):
     if not second.lower().endswith(".png"):
         second = second + ".png"
     
-    path1 = os.path.join(IMAGE_DIR, first.lower())
-    path2 = os.path.join(IMAGE_DIR, second.lower())
+    path1 = await run_blocking(image_index.path, first)
+    path2 = await run_blocking(image_index.path, second)
     
-    if not os.path.exists(path1):
+    if path1 is None:
         await ctx.send(f"❌ Image `{first}` not found in the images folder.")
         return
-    if not os.path.exists(path2):
+    if path2 is None:
         await ctx.send(f"❌ Image `{second}` not found in the images folder.")
         return
     
     try:
-        image1 = Image.open(path1).convert("RGB")
-        image2 = Image.open(path2).convert("RGB")
-        swapped_image = swap_faces(image1, image2)
+        swapped_png = await run_blocking(render_swap, path1, path2)
         timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
         filename = f"swapped_{timestamp}.png"
         image_path = os.path.join(IMAGE_DIR, filename)
-        # Save the swapped image to disk
-        swapped_image.save(image_path)
+        # Store the swapped image on disk in the background; sends use the bytes in memory
+        save = asyncio.ensure_future(run_blocking(write_file, image_path, swapped_png))
         # Retrieve the target channel
         target_channel = await get_target_channel()
         if target_channel:
-            # Now read the saved image from disk and send it (similar to !local)
             await target_channel.send(f"🧠 Face swap complete! Stored as `{filename}`.", 
-                                    file=discord.File(image_path))
+                                    file=discord.File(BytesIO(swapped_png), filename=filename))
             # Optionally, send a message to the original channel
-            image_path = os.path.join(IMAGE_DIR, filename)
-            if os.path.exists(image_path):
-                await ctx.send(f"📂 Sending local image: `{filename}`", file=discord.File(image_path))
+            await ctx.send(f"📂 Sending local image: `{filename}`", file=discord.File(BytesIO(swapped_png), filename=filename))
                                       
             await ctx.send("✅ Swapped image posted to the target channel.")
         else:
             await ctx.send("❌ Could not find the target channel.")
+        await save
     except Exception as e:
         await ctx.send("An error occurred while processing the face swap. Please try again.")
         print(e)
@@ -115,9 +221,10 @@ async def swap_error(ctx, error):
 async def local(ctx, name: str):
     # Looks for a file named "<name>.png" in the images folder
     filename = f"{name.lower()}.png"
-    image_path = os.path.join(IMAGE_DIR, filename)
-    if os.path.exists(image_path):
-        await ctx.send(f"📂 Sending local image: `{filename}`", file=discord.File(image_path))
+    image_path = await run_blocking(image_index.path, filename)
+    if image_path is not None:
+        data = await run_blocking(read_file, image_path)
+        await ctx.send(f"📂 Sending local image: `{filename}`", file=discord.File(BytesIO(data), filename=filename))
     else:
         await ctx.send(f"❌ Image `{filename}` not found in the images folder.")
 
@@ -136,6 +243,11 @@ async def on_command_error(ctx, error):
     else:
         pass
 
+# --- Precompute landmarks for every stored image once the bot is up ---
+@bot.event
+async def on_ready():
+    await run_blocking(index_faces)
+
 # --- on_message event for extra responses (e.g., "cookie") ---
 @bot.event
 async def on_message(message):
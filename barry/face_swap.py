@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import threading
+import cv2
+import numpy as np
+
+# --- Face Swap Settings ---
+LANDMARK_MODEL = os.environ.get("LANDMARK_MODEL", "shape_predictor_68_face_landmarks.dat")  # dlib's 68-point model
+INDEX_FILE = ".face_index.json"
+DETECT_MAX_SIDE = 1024      # Large images are downscaled for detection; landmarks use full resolution
+CLONE_MARGIN = 16           # Pixels around the face kept in the region handed to seamlessClone
+BLEND_MAX_SIDE = 384        # Larger faces are blended at this size; the Poisson solve grows with face area
+CROP_PREFIXES = ("face_", "first_face_")  # Names of face crops saved by the server
+
+
+class FaceIndex:
+    """
+    The 68 dlib landmarks of the main face in each image of a folder, kept in INDEX_FILE.
+
+    Entries are keyed by the SHA-1 of the image bytes, so copies and renamed files share
+    them; a (mtime, size, hash) record per file name avoids re-hashing unchanged files.
+    Detection runs once per distinct image, after which a swap is only a warp and a blend.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, INDEX_FILE)
+        self.lock = threading.Lock()
+        self.files = {}     # name -> [mtime_ns, size, sha1]
+        self.faces = {}     # sha1 -> landmarks as [[x, y], ...], or None if no face was found
+        self._models = None
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.files, self.faces = data["files"], data["faces"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def landmarks(self, path, persist=True):
+        """Landmarks of the face in `path` as a (68, 2) float32 array, or None if it has no face."""
+        with self.lock:
+            digest = self._file_hash(path)
+            if digest not in self.faces:
+                self.faces[digest] = self._locate(path)
+                if persist:
+                    self._save()
+            points = self.faces[digest]
+        return None if points is None else np.array(points, np.float32)
+
+    def update_all(self):
+        """Indexes every PNG in the folder that isn't indexed yet and forgets deleted ones."""
+        names = [name for name in os.listdir(self.directory) if name.lower().endswith(".png")]
+        for name in names:
+            self.landmarks(os.path.join(self.directory, name), persist=False)
+        with self.lock:
+            self.files = {name: record for name, record in self.files.items() if name in names}
+            hashes = {record[2] for record in self.files.values()}
+            self.faces = {digest: points for digest, points in self.faces.items() if digest in hashes}
+            self._save()
+        return sum(points is not None for points in self.faces.values())
+
+    def _file_hash(self, path):
+        stat = os.stat(path)
+        name = os.path.basename(path)
+        record = self.files.get(name)
+        if record and record[0] == stat.st_mtime_ns and record[1] == stat.st_size:
+            return record[2]
+        with open(path, "rb") as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        self.files[name] = [stat.st_mtime_ns, stat.st_size, digest]
+        return digest
+
+    def _save(self):
+        temp_path = self.path + ".part"
+        with open(temp_path, "w") as f:
+            json.dump({"files": self.files, "faces": self.faces}, f)
+        os.replace(temp_path, self.path)
+
+    def _load_models(self):
+        if self._models is None:
+            import dlib
+            if not os.path.exists(LANDMARK_MODEL):
+                raise RuntimeError(f"Landmark model not found: {LANDMARK_MODEL} (set LANDMARK_MODEL)")
+            self._models = (dlib, dlib.get_frontal_face_detector(), dlib.shape_predictor(LANDMARK_MODEL))
+        return self._models
+
+    def _locate(self, path):
+        dlib, detector, predictor = self._load_models()
+        image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            return None
+        height, width = image.shape
+        scale = min(1.0, DETECT_MAX_SIDE / max(height, width))
+        small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else image
+
+        faces = detector(small, 1)
+        if faces:
+            face = max(faces, key=lambda rect: rect.area())
+            rect = dlib.rectangle(int(face.left() / scale), int(face.top() / scale),
+                                  int(face.right() / scale), int(face.bottom() / scale))
+        elif os.path.basename(path).startswith(CROP_PREFIXES) and 0.7 < width / height < 1.3:
+            # Face crops saved by the server are often too tight for the detector
+            rect = dlib.rectangle(0, 0, width - 1, height - 1)
+        else:
+            return None
+        shape = predictor(image, rect)
+        return [[point.x, point.y] for point in shape.parts()]
+
+
+def delaunay_triangles(points, size):
+    """Delaunay triangulation of `points` as an (n, 3) array of point indices."""
+    width, height = size
+    points = np.clip(points, 0, [width - 1, height - 1])
+    subdiv = cv2.Subdiv2D((0, 0, width, height))
+    for x, y in points:
+        subdiv.insert((float(x), float(y)))
+    corners = subdiv.getTriangleList().reshape(-1, 3, 2)
+    # Map each corner back to its landmark; triangles touching Subdiv2D's outer helper vertices don't match any
+    distances = np.linalg.norm(corners[:, :, None, :] - points[None, None, :, :], axis=3)
+    indices = distances.argmin(axis=2)
+    matched = (distances.min(axis=2) < 1.0).all(axis=1)
+    return indices[matched]
+
+
+def warp_triangle(source, target, source_triangle, target_triangle):
+    sx, sy, sw, sh = cv2.boundingRect(np.float32([source_triangle]))
+    tx, ty, tw, th = cv2.boundingRect(np.float32([target_triangle]))
+    if sw == 0 or sh == 0 or tw == 0 or th == 0:
+        return
+    matrix = cv2.getAffineTransform(np.float32(source_triangle - (sx, sy)), np.float32(target_triangle - (tx, ty)))
+    warped = cv2.warpAffine(source[sy:sy+sh, sx:sx+sw], matrix, (tw, th), flags=cv2.INTER_LINEAR,
+                            borderMode=cv2.BORDER_REFLECT_101)
+    mask = np.zeros((th, tw), np.uint8)
+    cv2.fillConvexPoly(mask, np.int32(np.round(target_triangle - (tx, ty))), 1)
+    region = target[ty:ty+th, tx:tx+tw]
+    inside = mask[:region.shape[0], :region.shape[1]] > 0
+    region[inside] = warped[:region.shape[0], :region.shape[1]][inside]
+
+
+def swap_face(target, source, target_points, source_points):
+    """
+    Puts the face of `source` onto `target` (BGR arrays): each landmark triangle is
+    warped affinely onto its counterpart, and the result is blended in with Poisson
+    (seamless) cloning so skin tone and lighting follow the target.
+    """
+    height, width = target.shape[:2]
+    target_points = np.clip(target_points, 0, [width - 1, height - 1])
+    source_points = np.clip(source_points, 0, [source.shape[1] - 1, source.shape[0] - 1])
+    hull = cv2.convexHull(np.int32(np.round(target_points)))
+    x, y, w, h = cv2.boundingRect(hull)
+
+    # Only the face region is warped and blended, so cost doesn't grow with the image size
+    x1, y1 = max(0, x - CLONE_MARGIN), max(0, y - CLONE_MARGIN)
+    x2, y2 = min(width, x + w + CLONE_MARGIN), min(height, y + h + CLONE_MARGIN)
+    region = target[y1:y2, x1:x2]
+    warped = region.copy()
+    local_points = target_points - (x1, y1)
+    for triangle in delaunay_triangles(local_points, (x2 - x1, y2 - y1)):
+        warp_triangle(source, warped, source_points[triangle], local_points[triangle])
+
+    mask = np.zeros(region.shape[:2], np.uint8)
+    cv2.fillConvexPoly(mask, hull - (x1, y1), 255)
+    output = target.copy()
+    output[y1:y2, x1:x2] = blend(warped, region, mask)
+    return output
+
+
+def blend(warped, region, mask):
+    """
+    Seamless-clones `warped` into `region` inside `mask`. Big regions are cloned at
+    BLEND_MAX_SIDE and only the change cloning made (a smooth color correction) is
+    scaled back up, so the face keeps its full-resolution detail.
+    """
+    height, width = mask.shape
+    scale = min(1.0, BLEND_MAX_SIDE / max(height, width))
+    if scale < 1.0:
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        small_warped = cv2.resize(warped, size, interpolation=cv2.INTER_AREA)
+        small_region = cv2.resize(region, size, interpolation=cv2.INTER_AREA)
+        small_mask = cv2.resize(mask, size, interpolation=cv2.INTER_NEAREST)
+    else:
+        small_warped, small_region, small_mask = warped, region, mask
+
+    x, y, w, h = cv2.boundingRect(small_mask)
+    cloned = cv2.seamlessClone(small_warped, small_region, small_mask, (x + w // 2, y + h // 2), cv2.NORMAL_CLONE)
+    if scale == 1.0:
+        return cloned
+
+    correction = cv2.resize(cloned.astype(np.float32) - small_warped, (width, height), interpolation=cv2.INTER_LINEAR)
+    blended = np.clip(warped + correction, 0, 255).astype(np.uint8)
+    return np.where(mask[:, :, None] > 0, blended, region)
@@ -0,0 +1,249 @@
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+import wave
+from collections import defaultdict
+from contextlib import contextmanager
+import cv2
+import numpy as np
+from audio_scrambler import (WAV_FORMAT_FOR_WIDTH, AudioScrambler, decode_samples, encode_samples, random_pitch_factor,
+                             scramble_wav)
+from blur_engine import FaceBlurEngine
+from frame_codec import FrameCodec
+from tracker_registry import TrackerLadder
+
+# --- Benchmark Settings ---
+seed = 1234
+still_image_path = "image.png"
+still_repeats = 10
+audio_path = "voice_recording.wav"
+audio_chunk_bytes = 1024        # Same as the server's CHUNK
+video_frames = 150
+video_size = (1280, 720)
+video_faces = 4
+face_sprite_size = 180          # Pixels; the faces in the synthetic video are scaled copies of image.png
+long_audio_seconds = 600
+regression_tolerance = 0.2      # Median slowdown beyond which --compare reports a regression
+
+
+class StageTimer:
+    """Collects seconds per stage; `record` doubles as a FaceBlurEngine timing hook."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def record(self, stage, seconds):
+        self.samples[stage].append(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def summary(self):
+        stages = {}
+        for stage, samples in self.samples.items():
+            ms = np.array(samples) * 1000
+            stages[stage] = {
+                "count": len(ms),
+                "total_s": round(float(ms.sum()) / 1000, 4),
+                "mean_ms": round(float(ms.mean()), 3),
+                "p50_ms": round(float(np.median(ms)), 3),
+                "p95_ms": round(float(np.percentile(ms, 95)), 3),
+                "max_ms": round(float(ms.max()), 3),
+            }
+        return stages
+
+
+def fixed_engine():
+    """An engine whose choices don't depend on measured time, so runs are comparable."""
+    return FaceBlurEngine(tracker_factory=TrackerLadder(budget=None) or None, frame_budget=None,
+                          auto_detection_scale=False)
+
+
+def synthetic_video(frames=video_frames, size=video_size, faces=video_faces):
+    """JPEG frames of `faces` copies of image.png drifting and bouncing over a textured background."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    portrait = cv2.imread(still_image_path)
+    sprite_height = int(face_sprite_size * portrait.shape[0] / portrait.shape[1])
+    sprite = cv2.resize(portrait, (face_sprite_size, sprite_height), interpolation=cv2.INTER_AREA)
+    background = cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3), np.uint8), (0, 0), 8)
+
+    positions = rng.uniform((0, 0), (width - face_sprite_size, height - sprite_height), (faces, 2))
+    velocities = rng.uniform(-6, 6, (faces, 2))
+    limits = np.array([width - face_sprite_size, height - sprite_height])
+    encoded = []
+    for _ in range(frames):
+        frame = background.copy()
+        for x, y in positions.astype(int):
+            frame[y:y + sprite_height, x:x + face_sprite_size] = sprite
+        encoded.append(cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes())
+        positions += velocities
+        bounced = (positions < 0) | (positions > limits)
+        velocities[bounced] *= -1
+        positions = np.clip(positions, 0, limits)
+    return encoded
+
+
+def synthetic_wav(seconds=long_audio_seconds, rate=48000, channels=2):
+    """A WAV file in memory: gliding tones over noise, written a minute at a time."""
+    rng = np.random.default_rng(seed)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        for start in range(0, seconds, 60):
+            t = np.arange(min(60, seconds - start) * rate) / rate + start
+            tone = 0.3 * np.sin(2 * np.pi * (220 + 40 * np.sin(t / 3)) * t)
+            signal = tone[:, None] + 0.05 * rng.standard_normal((len(t), channels))
+            wf.writeframes(np.clip(signal * 32767, -32768, 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def blur_frames(name, frames, still=False):
+    """Decode, detect, track, blur and encode every frame, as a /blur request would."""
+    timer = StageTimer()
+    engine = fixed_engine()
+    engine.add_timing_hook(timer.record)
+    codec = FrameCodec(output_format="jpeg")
+    # Load the detector model before anything is timed
+    engine.detect(cv2.cvtColor(codec.decode(frames[0]), cv2.COLOR_BGR2GRAY))
+    faces = 0
+    start = time.perf_counter()
+    for content in frames:
+        with timer.time("decode"):
+            frame = codec.decode(content)
+        if still:
+            engine.process_still(frame)
+        else:
+            engine.process(frame)
+            faces += len(engine.last_boxes)
+        with timer.time("encode"):
+            codec.encode(frame)
+    elapsed = time.perf_counter() - start
+    result = {"frames": len(frames), "fps": round(len(frames) / elapsed, 2), "stages": timer.summary()}
+    if not still:
+        result["faces_blurred"] = faces  # Summed over frames; a change here means detection or tracking behaves differently
+    return name, result
+
+
+def scramble_chunks(name, wav_bytes):
+    """Every CHUNK of the file through one AudioScrambler, as /scramble_chunk would see it."""
+    timer = StageTimer()
+    scrambler = AudioScrambler(seed, initial_factor=random_pitch_factor(random.Random(seed)))
+    with wave.open(io.BytesIO(wav_bytes), "rb") as wf:
+        channels = wf.getnchannels()
+        sample_format = WAV_FORMAT_FOR_WIDTH[wf.getsampwidth()]
+        frame_bytes = channels * wf.getsampwidth()
+        data = wf.readframes(wf.getnframes())
+    chunk_bytes = audio_chunk_bytes - audio_chunk_bytes % frame_bytes
+    for offset in range(0, len(data) - chunk_bytes + 1, chunk_bytes):
+        with timer.time("chunk_scramble"):
+            audio = decode_samples(data[offset:offset + chunk_bytes], channels, sample_format)
+            encode_samples(scrambler.process_chunk(audio, sample_format), sample_format)
+    return name, {"stages": timer.summary()}
+
+
+def scramble_file(name, wav_bytes, repeats=1):
+    """The whole file through the block-wise scrambler behind /scramble_full_file."""
+    timer = StageTimer()
+    with wave.open(io.BytesIO(wav_bytes), "rb") as wf:
+        duration = wf.getnframes() / wf.getframerate()
+    for _ in range(repeats):
+        with timer.time("file_scramble"):
+            scramble_wav(io.BytesIO(wav_bytes), io.BytesIO(), audio_chunk_bytes, seed)
+    mean_seconds = timer.summary()["file_scramble"]["mean_ms"] / 1000
+    return name, {"audio_seconds": round(duration, 2), "realtime_factor": round(duration / mean_seconds, 1),
+                  "stages": timer.summary()}
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    ladder = TrackerLadder(budget=None)
+    return {"commit": commit, "python": platform.python_version(), "numpy": np.__version__,
+            "opencv": cv2.__version__, "machine": platform.machine(), "cpus": os.cpu_count(),
+            "face_detector": os.environ.get("FACE_DETECTOR", "dlib"), "tracker": ladder.name if ladder else None,
+            "seed": seed}
+
+
+def run_benchmarks(selected=None, audio_seconds=long_audio_seconds):
+    with open(still_image_path, "rb") as f:
+        still = f.read()
+    with open(audio_path, "rb") as f:
+        recording = f.read()
+
+    suites = {
+        "blur_still": lambda: blur_frames("blur_still", [still] * still_repeats, still=True),
+        "blur_video": lambda: blur_frames("blur_video", synthetic_video()),
+        "scramble_chunks": lambda: scramble_chunks("scramble_chunks", recording),
+        "scramble_file": lambda: scramble_file("scramble_file", recording, repeats=5),
+        "scramble_long_file": lambda: scramble_file("scramble_long_file", synthetic_wav(audio_seconds)),
+    }
+    results = {}
+    for name, run in suites.items():
+        if selected and name not in selected:
+            continue
+        # Each suite's fixtures are built inside `run` but outside the timed stages
+        name, result = run()
+        results[name] = result
+        print_result(name, result)
+    return {"environment": environment(), "benchmarks": results}
+
+
+def print_result(name, result):
+    extras = ", ".join(f"{key}={value}" for key, value in result.items() if key != "stages")
+    print(f"{name}" + (f" ({extras})" if extras else ""))
+    for stage, stats in result["stages"].items():
+        print(f"  {stage:<16} n={stats['count']:<6} mean {stats['mean_ms']:>9.3f} ms"
+              f"  p50 {stats['p50_ms']:>9.3f} ms  p95 {stats['p95_ms']:>9.3f} ms")
+
+
+def compare(results, baseline, tolerance=regression_tolerance):
+    """Median change per stage against a previous run; returns the stages that slowed beyond `tolerance`."""
+    regressions = []
+    for name, result in results["benchmarks"].items():
+        for stage, stats in result["stages"].items():
+            before = baseline.get("benchmarks", {}).get(name, {}).get("stages", {}).get(stage)
+            if not before or not before["p50_ms"]:
+                continue
+            ratio = stats["p50_ms"] / before["p50_ms"]
+            flag = "REGRESSION" if ratio > 1 + tolerance else ""
+            print(f"{name}/{stage:<16} {before['p50_ms']:>9.3f} -> {stats['p50_ms']:>9.3f} ms  x{ratio:.2f} {flag}")
+            if flag:
+                regressions.append(f"{name}/{stage}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the blur and scramble hot paths on fixed, seeded inputs.")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Earlier results to check for regressions (exits 1 if any)")
+    parser.add_argument("--only", nargs="+", help="Run just these benchmarks")
+    parser.add_argument("--audio-seconds", type=int, default=long_audio_seconds, help="Length of the synthetic long recording")
+    parser.add_argument("--tolerance", type=float, default=regression_tolerance, help="Allowed median slowdown, e.g. 0.2 for 20%%")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.only, args.audio_seconds)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            raise SystemExit(f"Regressions: {', '.join(regressions)}")
@@ -0,0 +1,327 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import cv2
+from detection_scheduler import DetectionScheduler
+from face_detectors import create_detector, min_face_window
+from tracker_bank import TrackerBank
+from tracker_registry import TrackerLadder
+
+# --- Detection Settings ---
+detection_interval = 30         # Starting interval between re-detections; adapted per stream (see detection_scheduler)
+detection_width = 640           # Wider frames are downsampled to this for detection; boxes are mapped back to full resolution
+auto_detection_scale = False    # Adapt the scale per engine from measured detection time
+detection_time_budget = 0.04    # Seconds a detection pass may take when auto-scaling
+# The detector backend (see face_detectors) has a smallest face it can find, so each engine
+# keeps its detection scale high enough that faces this size stay detectable
+min_face_size = 80              # Smallest face (full-resolution px) detection must still find
+# Per-frame latency budget; refresh detections that would overrun it run in the background instead
+frame_budget = float(os.environ.get("FRAME_BUDGET_MS", 0)) / 1000 or None
+background_detect_workers = int(os.environ.get("BACKGROUND_DETECT_WORKERS", 2))
+
+# --- Tracking Settings (tracker types live in tracker_registry) ---
+grace_period = 10               # Frames a lost face keeps being blurred at its predicted position
+match_iou = 0.3                 # Min overlap for a detection to belong to an existing track
+max_tracks = 16                 # Per stream; further faces are blurred from detections alone
+
+# --- Anonymization Settings ---
+blur_mode = os.environ.get("BLUR_MODE", "gaussian")  # gaussian, downscale, pixelate, box or mask
+blur_kernel = (81, 81)          # The gaussian mode's fixed kernel
+blur_cells = 8                  # Privacy strength of the other modes: blur widths across a face
+min_blur_sigma = 12.5           # Sigma of blur_kernel, so no mode is weaker than gaussian on small faces
+mask_color = (0, 0, 0)
+
+_detector_local = threading.local()
+_background_pool = None
+_background_pool_lock = threading.Lock()
+
+
+def default_detector():
+    """The configured detector for the calling thread, created (and its model loaded) on first use."""
+    detect = getattr(_detector_local, "detect", None)
+    if detect is None:
+        detect = _detector_local.detect = create_detector()
+    return detect
+
+
+def background_pool():
+    """Thread pool shared by every engine for detections that run off the frame path."""
+    global _background_pool
+    with _background_pool_lock:
+        if _background_pool is None:
+            _background_pool = ThreadPoolExecutor(background_detect_workers, thread_name_prefix="detect")
+        return _background_pool
+
+
+# Every mode works in place on the ROI view it is given; OpenCV writes straight into `dst`
+# as long as its size matches, and _store copies back in case it ever had to reallocate.
+def _store(face_roi, result):
+    if result is not face_roi:
+        face_roi[:] = result
+
+
+def _blur_sigma(face_roi):
+    """Gaussian sigma giving the configured privacy strength for this face size."""
+    return max(min_blur_sigma, max(face_roi.shape[:2]) / blur_cells)
+
+
+def gaussian_blur(face_roi):
+    # Fixed kernel, so cost grows with face area and large faces keep more detail than in the other modes
+    _store(face_roi, cv2.GaussianBlur(face_roi, blur_kernel, 0, dst=face_roi))
+
+
+def downscale_blur(face_roi):
+    """Blurs a small copy and scales it back up; cost stays flat as the face grows."""
+    height, width = face_roi.shape[:2]
+    # Shrink so the blur is ~2px in the small copy
+    scale = min(1.0, 2.0 / _blur_sigma(face_roi))
+    small = cv2.resize(face_roi, (max(1, round(width * scale)), max(1, round(height * scale))),
+                       interpolation=cv2.INTER_AREA)
+    cv2.GaussianBlur(small, (0, 0), 2.0, dst=small)
+    _store(face_roi, cv2.resize(small, (width, height), dst=face_roi, interpolation=cv2.INTER_LINEAR))
+
+
+def pixelate(face_roi):
+    height, width = face_roi.shape[:2]
+    cell = _blur_sigma(face_roi)
+    small = cv2.resize(face_roi, (max(1, round(width / cell)), max(1, round(height / cell))),
+                       interpolation=cv2.INTER_AREA)
+    _store(face_roi, cv2.resize(small, (width, height), dst=face_roi, interpolation=cv2.INTER_NEAREST))
+
+
+def box_blur(face_roi):
+    """Three box filter passes approximating the Gaussian; box filters cost the same at any width."""
+    sigma = _blur_sigma(face_roi)
+    width = max(1, int(round((12 * sigma * sigma / 3 + 1) ** 0.5)))
+    for _ in range(3):
+        _store(face_roi, cv2.blur(face_roi, (width, width), dst=face_roi))
+
+
+def solid_mask(face_roi):
+    face_roi[:] = mask_color
+
+
+BLUR_MODES = {
+    "gaussian": gaussian_blur,
+    "downscale": downscale_blur,
+    "pixelate": pixelate,
+    "box": box_blur,
+    "mask": solid_mask,
+}
+
+
+def resolve_blur(mode=blur_mode):
+    if mode not in BLUR_MODES:
+        raise ValueError(f"Unknown blur mode: {mode} (expected one of {', '.join(BLUR_MODES)})")
+    return BLUR_MODES[mode]
+
+
+def blur_recipe(mode=blur_mode):
+    """
+    How a client should anonymize face boxes itself to match `mode`. Gaussian uses the
+    fixed `sigma`; the other modes use max(min_sigma, longest box side / cells), with
+    pixelate cells of that size. downscale and box are plain blurs of that strength.
+    """
+    return {
+        "mode": mode,
+        "sigma": min_blur_sigma,
+        "min_sigma": min_blur_sigma,
+        "cells": blur_cells,
+        "color": list(mask_color[::-1]),  # RGB
+    }
+
+
+class FaceBlurEngine:
+    """
+    Detect -> track -> blur pipeline for one video stream.
+
+    Used by the webcam loop in face_blur.py, by each server session and by batch jobs
+    (call `reset()` between unrelated images). The stages are pluggable:
+
+    - `detector(gray_frame)` returns (x1, y1, x2, y2) face boxes (default: the FACE_DETECTOR backend)
+    - `tracker_factory()` returns an OpenCV-style tracker with init/update (default: a
+      TrackerLadder starting at TRACKER_TYPE and stepping down to cheaper types under load)
+    - `blur(face_roi)` anonymizes a face region in place (default: the BLUR_MODE function)
+
+    Tracks live in a TrackerBank (see tracker_bank). `on_face(frame, bbox, track_id)` sees
+    every tracked face before it is blurred, and `tracker_budget()` may refuse new trackers,
+    in which case faces are blurred from the detection alone.
+
+    A DetectionScheduler picks the frames that run the detector. With a `frame_budget`
+    (seconds), refresh detections that would overrun it are sent to a background pool
+    and their faces merged into the tracks on a later frame; detection while nothing is
+    tracked always runs inline, so a new stream never waits for its first faces.
+
+    Timing hooks added with
+    `add_timing_hook` are called with (stage, seconds) for each "detect", "track" and
+    "blur" stage; callers can time their own stages the same way with `timed`.
+    """
+
+    def __init__(self, detector=None, tracker_factory=None, blur=resolve_blur(), on_face=None,
+                 tracker_budget=None, detection_interval=detection_interval, detection_width=detection_width,
+                 auto_detection_scale=auto_detection_scale, max_tracks=max_tracks, frame_budget=frame_budget):
+        self.detector = detector
+        if tracker_factory is None:
+            tracker_factory = TrackerLadder() or None  # None when no tracker type is available
+        self.tracks = TrackerBank(tracker_factory, max_tracks, grace_period, match_iou)
+        self.blur = blur
+        self.on_face = on_face
+        self.tracker_budget = tracker_budget
+        self.scheduler = DetectionScheduler(detection_interval, frame_budget)
+        self.detection_width = detection_width
+        self.detection_scale = None  # Set by auto-scaling; otherwise follows each frame's width
+        self.auto_detection_scale = auto_detection_scale
+        self.min_detection_scale = None  # Lowest scale that keeps min_face_size detectable, known on first detection
+        self.timing_hooks = []
+        self.expected_frame_size = None
+        self.background_detection = None
+        self.last_boxes = []  # (x, y, w, h) regions anonymized in the last processed frame
+
+    def reset(self):
+        self.tracks.clear()
+        self.last_boxes = []
+        self.scheduler.reset()
+        self.detection_scale = None
+        # Faces found on a frame before the reset don't belong to what comes next
+        self.background_detection = None
+
+    def add_timing_hook(self, hook):
+        self.timing_hooks.append(hook)
+
+    @contextmanager
+    def timed(self, stage):
+        if not self.timing_hooks:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            for hook in self.timing_hooks:
+                hook(stage, elapsed)
+
+    def detect(self, gray_frame):
+        """Runs the detector on a copy of the frame at most `detection_width` wide and returns full-resolution boxes."""
+        detector = self.detector or default_detector()
+        if self.min_detection_scale is None:
+            self.min_detection_scale = min(1.0, min_face_window(detector) / min_face_size)
+        scale = self.detection_scale
+        if scale is None:
+            scale = self.detection_width / gray_frame.shape[1]
+        scale = max(self.min_detection_scale, min(1.0, scale))
+        if scale < 1.0:
+            small = cv2.resize(gray_frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        else:
+            small = gray_frame
+
+        start = time.perf_counter()
+        faces = detector(small)
+        elapsed = time.perf_counter() - start
+
+        if self.auto_detection_scale:
+            # Shrink quickly when over budget, grow back slowly when there is headroom
+            next_scale = scale
+            if elapsed > detection_time_budget:
+                next_scale = scale * 0.8
+            elif elapsed < detection_time_budget / 2:
+                next_scale = scale * 1.1
+            self.detection_scale = max(self.min_detection_scale, min(1.0, next_scale))
+
+        if scale == 1.0:
+            return faces
+        return [(int(round(x1 / scale)), int(round(y1 / scale)), int(round(x2 / scale)), int(round(y2 / scale)))
+                for x1, y1, x2, y2 in faces]
+
+    def process(self, frame, apply_blur=True):
+        """
+        Blurs every tracked or newly detected face in `frame` (BGR, modified in place) and
+        returns it. With `apply_blur=False` the faces are only located, for clients that
+        blur `last_boxes` themselves.
+        """
+        height, width = frame.shape[:2]
+        if frame.shape[:2] != self.expected_frame_size:
+            # Boxes from another resolution are meaningless; start over on this frame
+            self.reset()
+            self.expected_frame_size = frame.shape[:2]
+
+        start = time.perf_counter()
+        detection_seconds = 0.0
+
+        if self.background_detection is not None and self.background_detection.done():
+            detection = self.background_detection.result()
+            self.background_detection = None
+            self._add_faces(frame, detection)
+
+        self.scheduler.update_motion(frame)
+        if self.scheduler.should_detect(self.tracks) and self.background_detection is None:
+            gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            if self.tracks and self.scheduler.over_budget():
+                self.background_detection = background_pool().submit(self._timed_detect, gray_frame)
+            else:
+                detection = self._timed_detect(gray_frame)
+                self._add_faces(frame, detection)
+                detection_seconds = detection[1]
+
+        with self.timed("track"):
+            visible = self.tracks.update(frame, lambda bbox: _clip_box(bbox, width, height))
+
+        boxes = [bbox for bbox, _ in visible]
+        # Faces without a tracker stay blurred where they were last detected until the next pass
+        for bbox in self.tracks.untracked:
+            bbox = _clip_box(bbox, width, height)
+            if bbox[2] > 0 and bbox[3] > 0:
+                boxes.append(bbox)
+        self.last_boxes = boxes
+
+        with self.timed("blur"):
+            if self.on_face is not None:
+                for bbox, track_id in visible:
+                    self.on_face(frame, bbox, track_id)
+            if apply_blur:
+                for x, y, w, h in boxes:
+                    self.blur(frame[y:y+h, x:x+w])
+
+        self.scheduler.frame_done(time.perf_counter() - start - detection_seconds)
+        return frame
+
+    def process_still(self, frame):
+        """
+        Blurs the faces of a standalone image from a single detection, without starting
+        trackers or touching the stream state, so one engine can serve many threads.
+        """
+        height, width = frame.shape[:2]
+        with self.timed("detect"):
+            faces = self.detect(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+        with self.timed("blur"):
+            for x1, y1, x2, y2 in faces:
+                x, y, w, h = _clip_box((x1, y1, x2 - x1, y2 - y1), width, height)
+                if w > 0 and h > 0:
+                    self.blur(frame[y:y+h, x:x+w])
+        return frame
+
+    def _timed_detect(self, gray_frame):
+        """Returns (faces, seconds taken); runs inline or on the background pool."""
+        start = time.perf_counter()
+        with self.timed("detect"):
+            faces = self.detect(gray_frame)
+        return faces, time.perf_counter() - start
+
+    def _add_faces(self, frame, detection):
+        """Merges a detection pass into the tracks; returns the faces left untracked."""
+        faces, elapsed = detection
+        boxes = [(x1, y1, x2 - x1, y2 - y1) for x1, y1, x2, y2 in faces]
+        tracked_before = len(self.tracks)
+        with self.timed("track"):
+            untracked = self.tracks.add_detections(frame, boxes, self.tracker_budget)
+        self.scheduler.detected(self.tracks, len(self.tracks) > tracked_before or bool(untracked), elapsed)
+        return untracked
+
+
+def _clip_box(bbox, width, height):
+    x, y, w, h = [int(v) for v in bbox]
+    x1, y1 = max(0, x), max(0, y)
+    x2, y2 = min(width, x + w), min(height, y + h)
+    return x1, y1, max(0, x2 - x1), max(0, y2 - y1)
@@ -0,0 +1,160 @@
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+from blur_engine import FaceBlurEngine
+from tracker_registry import TrackerLadder
+
+# --- Batch Settings ---
+segment_seconds = 10        # Target segment length; segments start on the first keyframe past each target
+warmup_frames = 15          # Frames before a segment fed through its engine (not written) so faces are tracked from the start
+output_fourcc = "mp4v"
+
+
+def probe(path):
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video: {path}")
+    info = {
+        "fps": capture.get(cv2.CAP_PROP_FPS) or 30.0,
+        "frames": int(capture.get(cv2.CAP_PROP_FRAME_COUNT)),
+        "size": (int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))),
+    }
+    capture.release()
+    return info
+
+
+def keyframe_indices(path):
+    """
+    Indices of keyframes, read from the compressed packets without decoding them.
+
+    Packets come in decode order, which matches display order unless the codec uses
+    B-frames; seeking to a slightly wrong index then only costs some extra decoding.
+    Returns None if this OpenCV build can't hand out raw packets.
+    """
+    capture = cv2.VideoCapture(path, cv2.CAP_FFMPEG)
+    if not capture.isOpened() or not capture.set(cv2.CAP_PROP_FORMAT, -1):
+        return None
+    keyframes, index = [], 0
+    while True:
+        ok, _ = capture.read()
+        if not ok:
+            break
+        if capture.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+            keyframes.append(index)
+        index += 1
+    capture.release()
+    return keyframes or None
+
+
+def plan_segments(total_frames, target_frames, keyframes=None):
+    """Splits [0, total_frames) into (start, end) ranges of about `target_frames`, starting on keyframes when known."""
+    starts = [0]
+    candidates = keyframes if keyframes else range(total_frames)
+    for index in candidates:
+        if index - starts[-1] >= target_frames and index < total_frames:
+            starts.append(index)
+    return list(zip(starts, starts[1:] + [total_frames]))
+
+
+def _init_worker():
+    # One process per core already; OpenCV's own thread pool would only oversubscribe
+    cv2.setNumThreads(1)
+
+
+def blur_segment(path, start, end, part_path, fps, size, warmup=warmup_frames):
+    """Blurs frames [start, end) of `path` into `part_path`; returns (frames written, seconds)."""
+    began = time.perf_counter()
+    # Offline: detect inline and keep the preferred tracker however slow a frame is, so the
+    # output doesn't depend on machine load
+    engine = FaceBlurEngine(tracker_factory=TrackerLadder(budget=None) or None, frame_budget=None)
+    capture = cv2.VideoCapture(path)
+    first = max(0, start - warmup)
+    if first:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, first)
+
+    writer = cv2.VideoWriter(part_path, cv2.VideoWriter_fourcc(*output_fourcc), fps, size)
+    written = 0
+    try:
+        for index in range(first, end):
+            ok, frame = capture.read()
+            if not ok:
+                break
+            blurred = engine.process(frame)
+            if index >= start:
+                writer.write(blurred)
+                written += 1
+    finally:
+        capture.release()
+        writer.release()
+    return written, time.perf_counter() - began
+
+
+def join_segments(part_paths, source_path, output_path, fps, size):
+    """
+    Concatenates the segment files into `output_path`.
+
+    With an ffmpeg binary on PATH the parts are joined without re-encoding and the
+    source's audio is copied over; otherwise frames are re-encoded by OpenCV and the
+    output has no audio track.
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg:
+        list_path = os.path.join(os.path.dirname(part_paths[0]), "segments.txt")
+        with open(list_path, "w") as f:
+            f.writelines(f"file '{os.path.abspath(p)}'\n" for p in part_paths)
+        subprocess.run([ffmpeg, "-v", "error", "-y", "-f", "concat", "-safe", "0", "-i", list_path, "-i", source_path,
+                        "-map", "0:v", "-map", "1:a?", "-c", "copy", output_path], check=True)
+        return
+
+    writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*output_fourcc), fps, size)
+    try:
+        for part_path in part_paths:
+            capture = cv2.VideoCapture(part_path)
+            while True:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                writer.write(frame)
+            capture.release()
+    finally:
+        writer.release()
+
+
+def blur_video(input_path, output_path, workers=None, seconds=segment_seconds):
+    info = probe(input_path)
+    fps, size = info["fps"], info["size"]
+    segments = plan_segments(info["frames"], max(1, int(seconds * fps)), keyframe_indices(input_path))
+    start = time.perf_counter()
+
+    with tempfile.TemporaryDirectory(prefix="blur_video_") as parts_dir:
+        part_paths = [os.path.join(parts_dir, f"segment_{i:05d}.mp4") for i in range(len(segments))]
+        frames = 0
+        with ProcessPoolExecutor(workers, initializer=_init_worker) as pool:
+            futures = {pool.submit(blur_segment, input_path, s, e, part, fps, size): (s, e)
+                       for (s, e), part in zip(segments, part_paths)}
+            for future in as_completed(futures):
+                written, elapsed = future.result()
+                frames += written
+                s, e = futures[future]
+                print(f"Frames {s}-{e}: {written} blurred in {elapsed:.1f}s")
+        join_segments(part_paths, input_path, output_path, fps, size)
+
+    elapsed = time.perf_counter() - start
+    return {"frames": frames, "segments": len(segments), "seconds": round(elapsed, 2),
+            "fps": round(frames / elapsed, 1) if elapsed else None}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Blur every face in a recorded video file, headless.")
+    parser.add_argument("input", help="Video file to anonymize")
+    parser.add_argument("output", help="Where to write the blurred video")
+    parser.add_argument("--workers", type=int, help="Processes to use (default: one per core)")
+    parser.add_argument("--segment-seconds", type=float, default=segment_seconds, help="Target length of each parallel segment")
+    args = parser.parse_args()
+
+    print(blur_video(args.input, args.output, args.workers, args.segment_seconds))
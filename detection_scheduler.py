@@ -0,0 +1,81 @@
+import cv2
+import numpy as np
+
+# --- Scheduling Settings ---
+min_detection_interval = 5      # Frames between detections while faces come and go
+max_detection_interval = 90     # Frames between detections in a settled scene
+confident_iou = 0.6             # Tracks overlapping their detections this well are trusted for longer
+motion_threshold = 0.04         # Mean absolute thumbnail difference (0-1) that counts as a scene change
+motion_width = 64               # Thumbnail width for the motion score
+cost_smoothing = 0.2            # Weight of the newest timing in the cost estimates
+
+
+class DetectionScheduler:
+    """
+    Decides which frames of a stream run the face detector.
+
+    Detection always runs while a track is lost or a face is only known from the last
+    detection (no tracker could be spared for it). While nothing is tracked it runs every
+    `min_detection_interval` frames, or as soon as the scene moves. Otherwise the interval
+    adapts to tracker confidence: it halves when detections disagree with the tracks or
+    reveal new faces and grows by half while they agree. A cheap frame difference score
+    brings detection forward when the scene moves, so faces entering are picked up
+    quickly without detecting every frame of a static shot.
+
+    Frames are counted from the last detection, whether or not it found anything new.
+    """
+
+    def __init__(self, interval, frame_budget=None):
+        self.interval = interval
+        self.frame_budget = frame_budget
+        self.frames_since_detection = min_detection_interval  # Due, so a stream's first frame is detected
+        self.motion = 0.0
+        self.frame_cost = 0.0       # Smoothed seconds per frame, detection excluded
+        self.detection_cost = 0.0   # Smoothed seconds per detection
+        self._thumbnail = None
+
+    def reset(self):
+        self.frames_since_detection = min_detection_interval
+        self._thumbnail = None
+
+    def update_motion(self, frame):
+        height, width = frame.shape[:2]
+        size = (motion_width, max(1, round(height * motion_width / width)))
+        thumbnail = cv2.cvtColor(cv2.resize(frame, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        if self._thumbnail is None:
+            self.motion = 0.0
+        else:
+            self.motion = float(cv2.absdiff(thumbnail, self._thumbnail).mean()) / 255.0
+        self._thumbnail = thumbnail
+        return self.motion
+
+    def should_detect(self, tracks):
+        self.frames_since_detection += 1
+        if tracks.has_lost_tracks() or tracks.untracked:
+            return True
+        if not tracks:
+            return self.frames_since_detection >= min_detection_interval or self.motion > motion_threshold
+        if self.frames_since_detection >= self.interval:
+            return True
+        return self.motion > motion_threshold and self.frames_since_detection >= min_detection_interval
+
+    def detected(self, tracks, new_faces, elapsed=None):
+        """Records a detection pass and adapts the interval to how well it agreed with the tracks."""
+        self.frames_since_detection = 0
+        if elapsed is not None:
+            self.detection_cost = _smooth(self.detection_cost, elapsed)
+        if new_faces or tracks.confidence < confident_iou:
+            self.interval = max(min_detection_interval, self.interval // 2)
+        else:
+            self.interval = min(max_detection_interval, int(np.ceil(self.interval * 1.5)))
+
+    def frame_done(self, elapsed):
+        self.frame_cost = _smooth(self.frame_cost, elapsed)
+
+    def over_budget(self):
+        """True if detecting inline would likely push this frame past the caller's budget."""
+        return self.frame_budget is not None and self.frame_cost + self.detection_cost > self.frame_budget
+
+
+def _smooth(average, value):
+    return value if average == 0.0 else average + cost_smoothing * (value - average)
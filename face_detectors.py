@@ -0,0 +1,133 @@
+import os
+import cv2
+
+# --- Detector Settings (override with environment variables) ---
+face_detector = os.environ.get("FACE_DETECTOR", "dlib")      # dlib, yunet, dnn or haar
+detector_model = os.environ.get("FACE_DETECTOR_MODEL")       # Model file for yunet, dnn and haar
+detector_config = os.environ.get("FACE_DETECTOR_CONFIG")     # Network description for dnn (.prototxt)
+detection_upsample = 1          # dlib upsampling passes
+score_threshold = 0.6           # Minimum confidence for the yunet and dnn backends
+nms_threshold = 0.3
+dnn_input_size = (300, 300)     # The res10 SSD face model's input
+haar_scale_factor = 1.1
+haar_min_neighbors = 5
+
+# Smallest face (px, at the detector's input) each backend finds reliably; bounds how far frames may be downscaled
+MIN_FACE_WINDOW = {"dlib": 80, "yunet": 20, "dnn": 30, "haar": 30}
+
+
+def dlib_detector(upsample=detection_upsample):
+    """dlib's HOG face detector as a function of a grayscale frame returning (x1, y1, x2, y2) boxes."""
+    import dlib
+
+    detector = dlib.get_frontal_face_detector()
+
+    def detect(gray_frame):
+        return [(f.left(), f.top(), f.right(), f.bottom()) for f in detector(gray_frame, upsample)]
+
+    detect.min_face_window = MIN_FACE_WINDOW["dlib"] / 2 ** upsample
+    return detect
+
+
+def yunet_detector(model_path=None):
+    """OpenCV's YuNet CNN (face_detection_yunet_*.onnx); much faster than HOG and finds turned faces."""
+    model_path = _require_model(model_path or detector_model, "yunet")
+    detector = cv2.FaceDetectorYN.create(model_path, "", (320, 320), score_threshold, nms_threshold)
+
+    def detect(gray_frame):
+        height, width = gray_frame.shape[:2]
+        detector.setInputSize((width, height))
+        _, faces = detector.detect(cv2.cvtColor(gray_frame, cv2.COLOR_GRAY2BGR))
+        if faces is None:
+            return []
+        return [(int(x), int(y), int(x + w), int(y + h)) for x, y, w, h in faces[:, :4]]
+
+    detect.min_face_window = MIN_FACE_WINDOW["yunet"]
+    return detect
+
+
+def dnn_detector(model_path=None, config_path=None):
+    """OpenCV's res10 SSD face detector (Caffe or TensorFlow weights plus their network description)."""
+    model_path = _require_model(model_path or detector_model, "dnn")
+    net = cv2.dnn.readNet(model_path, config_path or detector_config or "")
+
+    def detect(gray_frame):
+        height, width = gray_frame.shape[:2]
+        blob = cv2.dnn.blobFromImage(cv2.cvtColor(gray_frame, cv2.COLOR_GRAY2BGR), 1.0, dnn_input_size,
+                                     (104.0, 177.0, 123.0))
+        net.setInput(blob)
+        detections = net.forward().reshape(-1, 7)
+        detections = detections[detections[:, 2] >= score_threshold]
+        boxes = detections[:, 3:7] * (width, height, width, height)
+        return [(int(x1), int(y1), int(x2), int(y2)) for x1, y1, x2, y2 in boxes]
+
+    detect.min_face_window = MIN_FACE_WINDOW["dnn"]
+    return detect
+
+
+def haar_detector(model_path=None):
+    """OpenCV's Haar cascade; the cheapest option, frontal faces only."""
+    model_path = model_path or detector_model
+    if model_path is None and hasattr(cv2, "data"):
+        model_path = os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+    cascade = cv2.CascadeClassifier(_require_model(model_path, "haar"))
+    if cascade.empty():
+        raise ValueError(f"Could not load Haar cascade from {model_path}")
+    min_size = MIN_FACE_WINDOW["haar"]
+
+    def detect(gray_frame):
+        faces = cascade.detectMultiScale(gray_frame, haar_scale_factor, haar_min_neighbors, minSize=(min_size, min_size))
+        return [(int(x), int(y), int(x + w), int(y + h)) for x, y, w, h in faces]
+
+    detect.min_face_window = min_size
+    return detect
+
+
+DETECTORS = {
+    "dlib": dlib_detector,
+    "yunet": yunet_detector,
+    "dnn": dnn_detector,
+    "haar": haar_detector,
+}
+
+
+def create_detector(name=face_detector):
+    """
+    Builds the configured detector backend, loading its model now.
+
+    If a model-based backend can't be loaded (missing file, or an OpenCV build without it)
+    this falls back to dlib's HOG detector rather than leaving faces unblurred.
+    """
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown face detector: {name} (expected one of {', '.join(DETECTORS)})")
+    if name == "dlib":
+        return dlib_detector()
+    try:
+        return DETECTORS[name]()
+    except (ValueError, AttributeError, cv2.error) as e:
+        print(f"Face detector '{name}' unavailable ({e}); falling back to dlib")
+        return dlib_detector()
+
+
+def min_face_window(detector=None):
+    """
+    Smallest face `detector` finds reliably, in px at its input.
+
+    Detectors from create_detector carry this as `min_face_window`, so a fallback reports
+    the backend actually built; a wrapper may set it to a function instead when it only
+    knows once its detector exists. Other callables are assumed to be the configured backend.
+    """
+    window = getattr(detector, "min_face_window", None)
+    if callable(window):
+        window = window()
+    if window is not None:
+        return window
+    if face_detector == "dlib":
+        return MIN_FACE_WINDOW["dlib"] / 2 ** detection_upsample
+    return MIN_FACE_WINDOW.get(face_detector, MIN_FACE_WINDOW["dlib"])
+
+
+def _require_model(path, name):
+    if not path or not os.path.exists(path):
+        raise ValueError(f"{name} needs a model file (set FACE_DETECTOR_MODEL); got {path!r}")
+    return path
@@ -0,0 +1,107 @@
+import os
+import queue
+import re
+import threading
+import cv2
+
+# --- Snapshot Settings (override with environment variables) ---
+snapshot_directory = os.environ.get("SNAPSHOT_DIR", "barry/images")
+snapshot_queue_depth = int(os.environ.get("SNAPSHOT_QUEUE_DEPTH", 32))  # Crops waiting for disk at once
+snapshots_per_session = int(os.environ.get("SNAPSHOTS_PER_SESSION", 5))
+min_snapshot_size = 40          # Faces smaller than this (px) aren't worth keeping
+
+
+class SnapshotWriter:
+    """
+    Writes face crops to disk on a background thread.
+
+    `submit` only copies the crop onto a bounded queue and never waits, so a slow disk
+    drops snapshots (counted in `dropped`) instead of stalling the frame that found the face.
+    """
+
+    def __init__(self, directory=snapshot_directory, queue_depth=snapshot_queue_depth):
+        self.directory = directory
+        self.queue = queue.Queue(queue_depth)
+        self.written = 0
+        self.dropped = 0        # Queue was full
+        self.failed = 0         # Encode or write errors
+        self._thread = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def submit(self, filename, crop):
+        """Queues `crop` to be saved as `filename`; returns False if it had to be dropped."""
+        self._ensure_started()
+        try:
+            self.queue.put_nowait((filename, crop.copy()))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def session(self, session_id, quota=snapshots_per_session):
+        """An engine `on_face` hook that saves each new track of one session once, up to `quota` faces."""
+        return SessionSnapshots(self, session_id, quota)
+
+    def close(self, timeout=5.0):
+        """Flushes queued snapshots and stops the writer thread."""
+        if self._thread is None:
+            return
+        self.queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            filename, crop = item
+            try:
+                if cv2.imwrite(os.path.join(self.directory, filename), crop):
+                    self.written += 1
+                else:
+                    self.failed += 1
+            except cv2.error:
+                self.failed += 1
+
+
+class SessionSnapshots:
+    """Per-session capture state: which tracks were saved and how much quota is left."""
+
+    def __init__(self, writer, session_id, quota):
+        self.writer = writer
+        # Session ids come from clients, so keep them to safe filename characters
+        self.prefix = re.sub(r"[^A-Za-z0-9_-]", "", str(session_id))[:36] or "session"
+        self.quota = quota
+        self.saved_tracks = set()
+        self.over_quota = 0
+
+    def __call__(self, frame, bbox, track_id):
+        if track_id in self.saved_tracks:
+            return
+        if len(self.saved_tracks) >= self.quota:
+            self.over_quota += 1
+            return
+        x, y, w, h = bbox
+        if w < min_snapshot_size or h < min_snapshot_size:
+            return
+        # Only mark the track as saved once queued, so a drop is retried on a later frame
+        if self.writer.submit(f"face_{self.prefix}_{track_id}_{cv2.getTickCount()}.png", frame[y:y+h, x:x+w]):
+            self.saved_tracks.add(track_id)
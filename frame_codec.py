@@ -0,0 +1,96 @@
+import os
+import cv2
+import numpy as np
+
+# --- Transport Settings (override with environment variables) ---
+default_output_format = os.environ.get("BLUR_OUTPUT_FORMAT", "jpeg")
+default_quality = int(os.environ.get("BLUR_QUALITY", 95))
+
+# Raw buffers are tightly packed 8-bit pixels in one of these layouts
+RAW_PIXEL_FORMATS = {"bgr": 3, "rgb": 3, "bgra": 4, "rgba": 4}
+_TO_BGR = {"rgb": cv2.COLOR_RGB2BGR, "bgra": cv2.COLOR_BGRA2BGR, "rgba": cv2.COLOR_RGBA2BGR}
+_FROM_BGR = {"rgb": cv2.COLOR_BGR2RGB, "bgra": cv2.COLOR_BGR2BGRA, "rgba": cv2.COLOR_BGR2RGBA}
+
+OUTPUT_MEDIA_TYPES = {
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "raw": "application/octet-stream",
+}
+OUTPUT_EXTENSIONS = {"jpeg": "jpg", "webp": "webp", "raw": "raw"}
+
+
+class FrameCodec:
+    """
+    How frames travel in and out of the blur pipeline.
+
+    Encoded images (JPEG, PNG, WebP...) are decoded with OpenCV. When `pixel_format`
+    is set, requests are instead raw `width` x `height` pixel buffers that are wrapped
+    with np.frombuffer, and raw responses use the same layout.
+    """
+
+    def __init__(self, pixel_format=None, width=None, height=None, output_format=None, quality=None):
+        self.pixel_format = pixel_format.lower() if pixel_format else None
+        self.width = width
+        self.height = height
+        self.output_format = (output_format or default_output_format).lower()
+        self.quality = default_quality if quality is None else max(1, min(100, quality))
+
+        if self.pixel_format is not None and self.pixel_format not in RAW_PIXEL_FORMATS:
+            raise ValueError(f"Unsupported pixel format: {pixel_format}")
+        if self.output_format not in OUTPUT_MEDIA_TYPES:
+            raise ValueError(f"Unsupported output format: {output_format}")
+
+    @classmethod
+    def negotiate(cls, accept=None, output_format=None, **kwargs):
+        """Builds a codec, picking the output format from `output_format` or else the Accept header."""
+        if output_format is None and accept:
+            if "image/webp" in accept:
+                output_format = "webp"
+            elif "application/octet-stream" in accept:
+                output_format = "raw"
+        return cls(output_format=output_format, **kwargs)
+
+    @property
+    def media_type(self):
+        return OUTPUT_MEDIA_TYPES[self.output_format]
+
+    @property
+    def extension(self):
+        return OUTPUT_EXTENSIONS[self.output_format]
+
+    def response_headers(self, frame):
+        if self.output_format != "raw":
+            return {}
+        height, width = frame.shape[:2]
+        return {
+            "X-Frame-Width": str(width),
+            "X-Frame-Height": str(height),
+            "X-Pixel-Format": self.pixel_format or "bgr",
+        }
+
+    def decode(self, content):
+        """Returns a writable BGR frame, or None if the content can't be read."""
+        if not content:
+            return None  # imdecode raises on an empty buffer
+        if self.pixel_format is None:
+            return cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
+
+        channels = RAW_PIXEL_FORMATS[self.pixel_format]
+        if not self.width or not self.height or len(content) != self.width * self.height * channels:
+            return None
+        pixels = np.frombuffer(content, np.uint8).reshape(self.height, self.width, channels)
+        if self.pixel_format == "bgr":
+            # frombuffer views are read-only and the blur writes in place
+            return pixels.copy()
+        return cv2.cvtColor(pixels, _TO_BGR[self.pixel_format])
+
+    def encode(self, frame):
+        if self.output_format == "raw":
+            if self.pixel_format and self.pixel_format != "bgr":
+                frame = cv2.cvtColor(frame, _FROM_BGR[self.pixel_format])
+            return frame.tobytes()
+        if self.output_format == "webp":
+            _, encoded = cv2.imencode(".webp", frame, [cv2.IMWRITE_WEBP_QUALITY, self.quality])
+        else:
+            _, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return encoded.tobytes()
@@ -0,0 +1,109 @@
+import bisect
+import threading
+
+# --- Metrics Settings ---
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implied
+latency_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = []
+
+
+class Histogram:
+    """
+    Prometheus histogram with one series per value of a single label.
+
+    Recording is a bisect and a few additions under a lock; buckets are only made
+    cumulative when the metrics are rendered.
+    """
+
+    def __init__(self, name, help, label, buckets=latency_buckets):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        self.series = {}    # label value -> [per-bucket counts (last is +Inf), sum]
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, label_value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_value)
+            if series is None:
+                series = self.series[label_value] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        with self.lock:
+            snapshot = {value: (list(counts), total) for value, (counts, total) in self.series.items()}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        bounds = [repr(float(bound)) for bound in self.buckets] + ["+Inf"]
+        for value, (counts, total) in sorted(snapshot.items()):
+            label = f'{self.label}="{_escape(value)}"'
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label}}} {total}")
+            lines.append(f"{self.name}_count{{{label}}} {cumulative}")
+        return lines
+
+
+class Counter:
+    """Prometheus counter, optionally split by one label."""
+
+    def __init__(self, name, help, label=None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values = {} if label else {None: 0}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, label_value=None, amount=1):
+        with self.lock:
+            self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def render(self):
+        with self.lock:
+            values = dict(self.values)
+        return sample_lines(self.name, self.help, "counter", values, self.label)
+
+
+def sample_lines(name, help, kind, values, label=None):
+    """Text-format lines for a gauge or counter; `values` maps label value (None if unlabelled) to a number."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for value, number in sorted(values.items(), key=lambda item: str(item[0])):
+        if label is None or value is None:
+            lines.append(f"{name} {number}")
+        else:
+            lines.append(f'{name}{{{label}="{_escape(value)}"}} {number}')
+    return lines
+
+
+def render(extra_lines=()):
+    """Every registered metric, followed by `extra_lines` (gauges read at scrape time), as Prometheus text."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# --- Pipeline Metrics ---
+blur_stage_seconds = Histogram("blur_stage_seconds", "Time per blur pipeline stage (decode, detect, track, blur, encode); "
+                               "the detect count is the number of detection passes.", "stage")
+pool_wait_seconds = Histogram("pool_wait_seconds", "Time jobs spend queued before a worker thread picks them up.", "pool")
+pool_run_seconds = Histogram("pool_run_seconds", "Time jobs spend running on a worker thread.", "pool")
+stream_frames_dropped = Counter("stream_frames_dropped_total", "Frames dropped from a /blur_ws socket's queue or shed by a full pool.")
+
+
+def record_blur_stage(stage, seconds):
+    """FaceBlurEngine timing hook."""
+    blur_stage_seconds.observe(seconds, stage)
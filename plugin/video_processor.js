@@ -1,7 +1,24 @@
+const SERVER_URL = "http://127.0.0.1:8000";
+const STREAM_URL = "ws://127.0.0.1:8000/blur_ws";
+const MAX_IN_FLIGHT = 3; // Frames sent over the socket before waiting for a reply
+const FRAME_ID_BYTES = 4;
+// Opt-in: the server only sends back face boxes and a blur recipe, and video is blurred
+// here. Cheaper, but the blur then depends on this client; off, the server blurs frames
+const BOX_MODE = false;
+
 export class VideoProcessor {
   constructor(constraints, originalGetUserMedia) {
     this.constraints = constraints;
     this.originalGetUserMedia = originalGetUserMedia;
+    // Lets the server keep separate face trackers for each stream
+    this.sessionId = crypto.randomUUID();
+    this.socket = null;
+    this.nextFrameId = 0;
+    this.inFlight = new Set();
+    this.lastDrawnId = -1;
+    this.boxes = [];
+    this.recipe = null;
+    this.pixelCanvas = document.createElement("canvas");
   }
 
   async process() {
@@ -17,7 +34,13 @@ export class VideoProcessor {
     await video.play();
     console.log("VideoProcessor: Video playing", video.videoWidth, video.videoHeight);
 
-    // Create canvas to capture frames
+    // Raw frames are grabbed on their own canvas so they never reach the outgoing stream
+    const captureCanvas = document.createElement("canvas");
+    captureCanvas.width = video.videoWidth;
+    captureCanvas.height = video.videoHeight;
+    const captureCtx = captureCanvas.getContext("2d");
+
+    // Create canvas for the blurred frames
     const canvas = document.createElement("canvas");
     canvas.width = video.videoWidth;
     canvas.height = video.videoHeight;
@@ -27,35 +50,51 @@ export class VideoProcessor {
     const processedStream = canvas.captureStream(15); // e.g., 15 fps
     const finalStream = new MediaStream();
 
+    this.openSocket(canvas, ctx);
+
     const render = async () => {
-      // Draw the current video frame onto the canvas
-      ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
-      console.log("VideoProcessor: Drew video frame to canvas");
+      if (BOX_MODE && this.recipe) {
+        // Show the live frame with the latest known boxes blurred on top; nothing is
+        // shown until the server has answered once
+        ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
+        this.anonymize(ctx, video);
+      }
+
+      if (this.socket && this.socket.readyState === WebSocket.OPEN) {
+        // Pipelined: keep a few frames in flight and let replies draw themselves
+        if (this.inFlight.size < MAX_IN_FLIGHT) {
+          captureCtx.drawImage(video, 0, 0, captureCanvas.width, captureCanvas.height);
+          this.sendFrameOverSocket(captureCanvas).catch((error) => {
+            console.error("VideoProcessor: Error sending frame:", error);
+          });
+        }
+        requestAnimationFrame(render);
+        return;
+      }
+
+      // Draw the current video frame onto the capture canvas
+      captureCtx.drawImage(video, 0, 0, captureCanvas.width, captureCanvas.height);
 
       try {
         // Convert canvas to blob and send it to the Python server
-        const blob = await this.sendFrameToServer(canvas);
-        console.log("VideoProcessor: Received blurred frame from server");
+        const blob = await this.sendFrameToServer(captureCanvas);
 
-        // Create an image from the processed blob
-        const img = new Image();
-        img.onload = () => {
+        if (BOX_MODE) {
+          this.applyBoxReply(JSON.parse(await blob.text()));
+        } else {
           // Draw the processed (blurred) frame onto the canvas
-          ctx.drawImage(img, 0, 0, canvas.width, canvas.height);
-          console.log("VideoProcessor: Rendered blurred image on canvas");
-          // Continue processing the next frame
-          requestAnimationFrame(render);
-        };
-        img.src = URL.createObjectURL(blob);
+          const bitmap = await createImageBitmap(blob);
+          ctx.drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+          bitmap.close();
+        }
       } catch (error) {
         console.error("VideoProcessor: Error processing frame:", error);
-        requestAnimationFrame(render);
       }
+      // Continue processing the next frame
+      requestAnimationFrame(render);
     };
 
-    video.addEventListener("play", () => {
-      requestAnimationFrame(render);
-    });
+    requestAnimationFrame(render);
 
     // Pipe the processed video track to the final stream
     processedStream.getVideoTracks().forEach((track) => finalStream.addTrack(track));
@@ -67,6 +106,116 @@ export class VideoProcessor {
     return finalStream;
   }
 
+  applyBoxReply(reply) {
+    // {"changed": false} means the boxes we already have still hold
+    if (reply.changed) {
+      this.boxes = reply.boxes;
+      this.recipe = reply.recipe;
+    }
+  }
+
+  anonymize(ctx, source) {
+    const recipe = this.recipe;
+    if (!recipe) {
+      return;
+    }
+    const { width, height } = ctx.canvas;
+    for (const [bx, by, bw, bh] of this.boxes) {
+      const pad = recipe.padding * Math.max(bw, bh);
+      const x = Math.max(0, Math.floor(bx - pad));
+      const y = Math.max(0, Math.floor(by - pad));
+      const w = Math.min(width - x, Math.ceil(bw + 2 * pad));
+      const h = Math.min(height - y, Math.ceil(bh + 2 * pad));
+      if (w <= 0 || h <= 0) {
+        continue;
+      }
+
+      if (recipe.mode === "mask") {
+        ctx.fillStyle = `rgb(${recipe.color.join(",")})`;
+        ctx.fillRect(x, y, w, h);
+        continue;
+      }
+
+      const sigma = recipe.mode === "gaussian" ? recipe.sigma : Math.max(recipe.min_sigma, Math.max(w, h) / recipe.cells);
+      if (recipe.mode === "pixelate") {
+        const cols = Math.max(1, Math.round(w / sigma));
+        const rows = Math.max(1, Math.round(h / sigma));
+        this.pixelCanvas.width = cols;
+        this.pixelCanvas.height = rows;
+        this.pixelCanvas.getContext("2d").drawImage(source, x, y, w, h, 0, 0, cols, rows);
+        ctx.imageSmoothingEnabled = false;
+        ctx.drawImage(this.pixelCanvas, 0, 0, cols, rows, x, y, w, h);
+        ctx.imageSmoothingEnabled = true;
+        continue;
+      }
+
+      // Blur a margin around the box too, so the edges don't fade into transparency
+      const margin = Math.ceil(2 * sigma);
+      const sx = Math.max(0, x - margin);
+      const sy = Math.max(0, y - margin);
+      const sw = Math.min(width - sx, w + 2 * margin);
+      const sh = Math.min(height - sy, h + 2 * margin);
+      ctx.save();
+      ctx.beginPath();
+      ctx.rect(x, y, w, h);
+      ctx.clip();
+      ctx.filter = `blur(${sigma}px)`;
+      ctx.drawImage(source, sx, sy, sw, sh, sx, sy, sw, sh);
+      ctx.restore();
+    }
+  }
+
+  openSocket(canvas, ctx) {
+    const output = BOX_MODE ? "&output=boxes" : "";
+    const socket = new WebSocket(`${STREAM_URL}?session_id=${this.sessionId}${output}`);
+    socket.binaryType = "arraybuffer";
+
+    socket.onmessage = async (event) => {
+      const frameId = new DataView(event.data).getUint32(0);
+      // Replies come back in order, so anything older was dropped by the server
+      for (const id of this.inFlight) {
+        if (id <= frameId) {
+          this.inFlight.delete(id);
+        }
+      }
+      if (event.data.byteLength <= FRAME_ID_BYTES || frameId <= this.lastDrawnId) {
+        return;
+      }
+      this.lastDrawnId = frameId;
+      if (BOX_MODE) {
+        this.applyBoxReply(JSON.parse(new TextDecoder().decode(event.data.slice(FRAME_ID_BYTES))));
+        return;
+      }
+      const blob = new Blob([event.data.slice(FRAME_ID_BYTES)], { type: "image/jpeg" });
+      const bitmap = await createImageBitmap(blob);
+      ctx.drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+      bitmap.close();
+    };
+
+    socket.onclose = () => {
+      // Fall back to per-frame HTTP requests
+      console.log("VideoProcessor: Stream socket closed, using HTTP");
+      this.socket = null;
+      this.inFlight.clear();
+    };
+
+    this.socket = socket;
+  }
+
+  async sendFrameOverSocket(canvas) {
+    const frameId = this.nextFrameId++;
+    this.inFlight.add(frameId);
+    const blob = await new Promise((resolve) => canvas.toBlob(resolve, "image/jpeg"));
+    if (!blob || !this.socket) {
+      this.inFlight.delete(frameId);
+      throw new Error("Canvas blob conversion failed");
+    }
+    const message = new Uint8Array(FRAME_ID_BYTES + blob.size);
+    new DataView(message.buffer).setUint32(0, frameId);
+    message.set(new Uint8Array(await blob.arrayBuffer()), FRAME_ID_BYTES);
+    this.socket.send(message);
+  }
+
   async sendFrameToServer(canvas) {
     return new Promise((resolve, reject) => {
       canvas.toBlob(async (blob) => {
@@ -77,8 +226,9 @@ export class VideoProcessor {
         formData.append("file", blob, "frame.jpg");
 
         try {
-          const response = await fetch("http://127.0.0.1:8000/blur", {
+          const response = await fetch(`${SERVER_URL}/blur${BOX_MODE ? "?output=boxes" : ""}`, {
             method: "POST",
+            headers: { "X-Session-ID": this.sessionId },
             body: formData,
           });
           if (!response.ok) {
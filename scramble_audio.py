@@ -1,119 +1,220 @@
-import pyaudio
-import numpy as np
+import argparse
 import random
+import threading
+import time
+import wave
+import numpy as np
+from audio_scrambler import WAV_FORMAT_FOR_WIDTH, StreamScrambler, decode_samples, encode_samples, random_pitch_factor
 
 # Audio settings
 CHUNK = 1024
-FORMAT = pyaudio.paInt16
 CHANNELS = 2
 RATE = 48000
 
-p = pyaudio.PyAudio()
-
-# --- Modulation Settings ---
-min_pitch_factor_low = 0.7   # Closer to 1.0
-max_pitch_factor_low = 0.9   # Closer to 1.0
-min_pitch_factor_high = 1.1  # Closer to 1.0
-max_pitch_factor_high = 1.3  # Closer to 1.0
-change_probability = 0.9
-change_frequency_factor = 3
-min_pitch_change_threshold = 0.20 # Increased threshold
-robotic_factor = 0.2
-distortion_level = 0.15
-
-audio_chunk_counter = 0
-current_pitch_factor = 1.0 # Initialize
-
-audio_chunk_counter = 0
-# Initialize with a random modulating pitch factor
-if random.random() < 0.5:
-    current_pitch_factor = random.uniform(min_pitch_factor_low, max_pitch_factor_low)
-else:
-    current_pitch_factor = random.uniform(min_pitch_factor_high, max_pitch_factor_high)
-
-def process_audio(audio_array):
-    global audio_chunk_counter
-    global current_pitch_factor
-
-    # --- Modulation Settings (Local for clarity) ---
-    min_pitch_factor_low = 0.7   # Closer to 1.0
-    max_pitch_factor_low = 0.9   # Closer to 1.0
-    min_pitch_factor_high = 1.1  # Closer to 1.0
-    max_pitch_factor_high = 1.3  # Closer to 1.0
-    change_probability = 0.9     # High probability
-    change_frequency_factor = 3  # More frequent
-    min_pitch_change_threshold = 0.15 # Keep this
-
-    if audio_chunk_counter % change_frequency_factor == 0:
-        if random.random() < change_probability:
-            while True: # Loop until we get a factor sufficiently far from 1.0
-                if random.random() < 0.5:
-                    potential_factor = random.uniform(min_pitch_factor_low, max_pitch_factor_low)
-                else:
-                    potential_factor = random.uniform(min_pitch_factor_high, max_pitch_factor_high)
-
-                if abs(potential_factor - 1.0) >= min_pitch_change_threshold:
-                    current_pitch_factor = potential_factor
-                    break # Exit the loop once a valid factor is found
-
-    pitch_factor = current_pitch_factor
-
-    if pitch_factor > 1.0:
-        new_length = int(len(audio_array) / pitch_factor)
-        if new_length > 0:
-            indices = np.round(np.linspace(0, len(audio_array) - 1, new_length)).astype(int)
-            modulated_audio = audio_array[indices]
-        else:
-            modulated_audio = np.array([], dtype=np.int16)
-    elif pitch_factor < 1.0:
-        repeat_factor = int(1 / pitch_factor)
-        modulated_audio = np.repeat(audio_array, repeat_factor)[:len(audio_array)]
+# --- Pipeline Settings ---
+SCRAMBLE_CHUNK = 256    # Frames per scrambling step (~5 ms at 48 kHz)
+FADE_FRAMES = 48        # Crossfade between scrambling steps
+RING_CHUNKS = 8         # Capacity of each ring buffer, in CHUNKs
+PREFILL_FRAMES = CHUNK  # Playback starts once this much scrambled audio is queued
+
+
+class RingBuffer:
+    """
+    Single-producer/single-consumer ring of audio frames.
+
+    Only the producer advances `write_pos` and only the consumer advances `read_pos`,
+    so the capture callback, the worker and the playback callback never wait on a lock.
+    Writes that don't fit are truncated and reads return at most what is available.
+    """
+
+    def __init__(self, capacity, channels, dtype):
+        self.data = np.zeros((capacity, channels), dtype)
+        self.capacity = capacity
+        self.write_pos = 0
+        self.read_pos = 0
+
+    def available(self):
+        return self.write_pos - self.read_pos
+
+    def write(self, frames):
+        count = min(len(frames), self.capacity - self.available())
+        start = self.write_pos % self.capacity
+        first = min(count, self.capacity - start)
+        self.data[start:start + first] = frames[:first]
+        self.data[:count - first] = frames[first:count]
+        self.write_pos += count
+        return count
+
+    def read(self, count):
+        count = min(count, self.available())
+        start = self.read_pos % self.capacity
+        first = min(count, self.capacity - start)
+        frames = np.concatenate((self.data[start:start + first], self.data[:count - first]))
+        self.read_pos += count
+        return frames
+
+
+class ScramblePipeline:
+    """
+    Capture -> ring buffer -> scrambling worker -> ring buffer -> playback.
+
+    `on_capture` and `on_playback` are called from the audio callbacks and only copy
+    frames; `process_pending` does the scrambling on the worker thread. Each counter is
+    written by a single thread.
+    """
+
+    def __init__(self, channels, sample_format="int16", seed=None):
+        self.scrambler = StreamScrambler(channels, sample_format, SCRAMBLE_CHUNK, FADE_FRAMES, seed,
+                                         initial_factor=random_pitch_factor(random.Random(seed)))
+        self.capture = RingBuffer(CHUNK * RING_CHUNKS, channels, self.scrambler.dtype)
+        self.playback = RingBuffer(CHUNK * RING_CHUNKS, channels, self.scrambler.dtype)
+        self.data_ready = threading.Event()
+        self.prefilled = False
+        self.capture_overruns = 0    # Captured audio dropped because the worker fell behind
+        self.playback_overruns = 0   # Scrambled audio dropped because playback fell behind
+        self.underruns = 0           # Playback callbacks padded with silence
+        self.frames_processed = 0
+        self.process_seconds = 0.0
+
+    def on_capture(self, frames):
+        if self.capture.write(frames) < len(frames):
+            self.capture_overruns += 1
+        self.data_ready.set()
+
+    def on_playback(self, count):
+        if not self.prefilled:
+            if self.playback.available() < PREFILL_FRAMES:
+                return np.zeros((count,) + self.playback.data.shape[1:], self.playback.data.dtype)
+            self.prefilled = True
+
+        frames = self.playback.read(count)
+        if len(frames) < count:
+            self.underruns += 1
+            self.prefilled = False
+            silence = np.zeros((count - len(frames),) + frames.shape[1:], frames.dtype)
+            frames = np.concatenate((frames, silence))
+        return frames
+
+    def process_pending(self):
+        frames = self.capture.read(self.capture.available())
+        if len(frames) == 0:
+            return 0
+
+        start = time.perf_counter()
+        scrambled = self.scrambler.process(frames)
+        self.process_seconds += time.perf_counter() - start
+        self.frames_processed += len(frames)
+
+        if self.playback.write(scrambled) < len(scrambled):
+            self.playback_overruns += 1
+        return len(frames)
+
+    def run_worker(self, stop_event):
+        while not stop_event.is_set():
+            self.data_ready.wait(0.05)
+            self.data_ready.clear()
+            self.process_pending()
+
+    def stats(self):
+        return {
+            "capture_overruns": self.capture_overruns,
+            "playback_overruns": self.playback_overruns,
+            "underruns": self.underruns,
+            "frames_processed": self.frames_processed,
+            "process_seconds": round(self.process_seconds, 4),
+        }
+
+
+def run_live():
+    import pyaudio
+
+    p = pyaudio.PyAudio()
+    pipeline = ScramblePipeline(CHANNELS, "int16")
+    stop_event = threading.Event()
+
+    def input_callback(in_data, frame_count, time_info, status):
+        pipeline.on_capture(decode_samples(in_data, CHANNELS, "int16"))
+        return (None, pyaudio.paContinue)
+
+    def output_callback(in_data, frame_count, time_info, status):
+        return (encode_samples(pipeline.on_playback(frame_count), "int16"), pyaudio.paContinue)
+
+    input_stream = output_stream = None
+    worker = threading.Thread(target=pipeline.run_worker, args=(stop_event,), daemon=True)
+    try:
+        input_stream = p.open(format=pyaudio.paInt16,
+                              channels=CHANNELS,
+                              rate=RATE,
+                              input=True,
+                              frames_per_buffer=CHUNK,
+                              stream_callback=input_callback)
+
+        output_stream = p.open(format=pyaudio.paInt16,
+                               channels=CHANNELS,
+                               rate=RATE,
+                               output=True,
+                               frames_per_buffer=CHUNK,
+                               stream_callback=output_callback)
+
+        worker.start()
+        print("Listening for audio... Press Ctrl+C to stop.")
+        while input_stream.is_active():
+            time.sleep(1)
+            print(pipeline.stats())
+
+    except KeyboardInterrupt:
+        print("\nStopping...")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+    finally:
+        stop_event.set()
+        for stream in (input_stream, output_stream):
+            if stream is not None:
+                stream.stop_stream()
+                stream.close()
+        p.terminate()
+
+
+def run_file(input_path, output_path, seed=None):
+    """Drives the live pipeline from a WAV file instead of audio devices, one CHUNK per callback."""
+    with wave.open(input_path, 'rb') as wf, wave.open(output_path, 'wb') as out_wf:
+        channels = wf.getnchannels()
+        sample_format = WAV_FORMAT_FOR_WIDTH.get(wf.getsampwidth())
+        if sample_format is None:
+            raise ValueError(f"Unsupported WAV sample width: {wf.getsampwidth()} bytes")
+        out_wf.setparams(wf.getparams())
+
+        pipeline = ScramblePipeline(channels, sample_format, seed)
+        start = time.perf_counter()
+        while True:
+            data = wf.readframes(CHUNK)
+            if not data:
+                break
+            frames = decode_samples(data, channels, sample_format)
+            pipeline.on_capture(frames)
+            pipeline.process_pending()
+            out_wf.writeframes(encode_samples(pipeline.on_playback(len(frames)), sample_format))
+
+        # Flush what is still queued for playback
+        remaining = pipeline.playback.read(pipeline.playback.available())
+        out_wf.writeframes(encode_samples(remaining, sample_format))
+        elapsed = time.perf_counter() - start
+        duration = wf.getnframes() / wf.getframerate()
+
+    stats = pipeline.stats()
+    stats["realtime_factor"] = round(duration / elapsed, 1) if elapsed else None
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scramble microphone audio live, or a WAV file offline.")
+    parser.add_argument("--input", help="WAV file to scramble instead of the microphone")
+    parser.add_argument("--output", default="scrambled_recording.wav", help="Where file mode writes its result")
+    parser.add_argument("--seed", type=int, help="Seed for a reproducible pitch schedule (file mode)")
+    args = parser.parse_args()
+
+    if args.input:
+        print(run_file(args.input, args.output, args.seed))
     else:
-        modulated_audio = audio_array
-
-
-    # Ensure the output data has the correct length
-    output_chunk_size_samples = CHUNK * CHANNELS
-    if len(modulated_audio) < output_chunk_size_samples:
-        padding = np.zeros(output_chunk_size_samples - len(modulated_audio), dtype=np.int16)
-        modulated_audio = np.concatenate((modulated_audio, padding))
-    elif len(modulated_audio) > output_chunk_size_samples:
-        modulated_audio = modulated_audio[:output_chunk_size_samples]
-
-    modified_data = modulated_audio.tobytes()
-    return modified_data
-
-try:
-    input_stream = p.open(format=FORMAT,
-                            channels=CHANNELS,
-                            rate=RATE,
-                            input=True,
-                            frames_per_buffer=CHUNK)
-
-    output_stream = p.open(format=FORMAT,
-                             channels=CHANNELS,
-                             rate=RATE,
-                             output=True)
-
-    print("Listening for audio... Press Ctrl+C to stop.")
-
-    while True:
-        data = input_stream.read(CHUNK)
-        audio_array = np.frombuffer(data, dtype=np.int16)
-
-        modulated_audio = process_audio(audio_array)
-        output_stream.write(modulated_audio)
-
-        audio_chunk_counter += 1
-
-except KeyboardInterrupt:
-    print("\nStopping...")
-except Exception as e:
-    print(f"An error occurred: {e}")
-
-finally:
-    input_stream.stop_stream()
-    input_stream.close()
-    output_stream.stop_stream()
-    output_stream.close()
-    p.terminate()
\ No newline at end of file
+        run_live()
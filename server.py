@@ -1,15 +1,36 @@
-from fastapi import FastAPI, File, UploadFile, Response
+from fastapi import FastAPI, File, Header, Request, UploadFile, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-import cv2
-import dlib
-import numpy as np
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import List, Optional
+import asyncio
 import os
 import pyaudio
-import random
-import wave
+import threading
+import time
+import uuid
 import io
-
-app = FastAPI()
+import json
+import re
+import tempfile
+import zipfile
+import workers
+from blur_engine import FaceBlurEngine, blur_recipe
+from face_snapshots import SnapshotWriter
+import metrics
+from tracker_registry import cost_report, cost_totals
+from audio_scrambler import (DEFAULT_FORMAT_FOR_WIDTH, SAMPLE_FORMATS, AudioScrambler, JitterBuffer, StreamScrambler,
+                             decode_samples, encode_samples, random_pitch_factor, scramble_wav)
+from frame_codec import FrameCodec
+from workers import Overloaded, audio_pool, blur_pool
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    workers.shutdown()
+    face_snapshots.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS for extension access
 app.add_middleware(
@@ -18,6 +39,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Frame-Width", "X-Frame-Height", "X-Pixel-Format"],
 )
 
 # Audio settings
@@ -28,230 +50,565 @@ RATE = 48000
 
 p = pyaudio.PyAudio()
 
-# --- Modulation Settings ---
-min_pitch_factor_low = 0.7   # Closer to 1.0
-max_pitch_factor_low = 0.9   # Closer to 1.0
-min_pitch_factor_high = 1.1  # Closer to 1.0
-max_pitch_factor_high = 1.3  # Closer to 1.0
-change_probability = 0.9
-change_frequency_factor = 3
-min_pitch_change_threshold = 0.20 # Increased threshold
-robotic_factor = 0.2
-distortion_level = 0.15
-
-audio_chunk_counter = 0
-current_pitch_factor = 1.0 # Initialize
-# Initialize with a random modulating pitch factor
-if random.random() < 0.5:
-    current_pitch_factor = random.uniform(min_pitch_factor_low, max_pitch_factor_low)
-else:
-    current_pitch_factor = random.uniform(min_pitch_factor_high, max_pitch_factor_high)
-
-# Setup
-detector = dlib.get_frontal_face_detector()
-trackers = []
-tracking_states = []
-bboxes = []
-tracker_type = 'CSRT'
-detection_interval = 30
-frame_count = 0
-expected_frame_size = None
-frames_since_lost_list = []
-grace_period = 10
-face_saved = False
-output_directory = "barry/images/"
-os.makedirs(output_directory, exist_ok=True)
-
-if tracker_type == 'KCF':
-    tracker_algorithm_type = cv2.TrackerKCF_create
-elif tracker_type == 'CSRT':
-    tracker_algorithm_type = cv2.TrackerCSRT_create
-elif tracker_type == 'MOSSE':
-    tracker_algorithm_type = cv2.TrackerMOSSE_create
-else:
-    tracker_algorithm_type = None
-
-def getBlurredImage(frame):
-    global frame_count, expected_frame_size, trackers, tracking_states, bboxes, frames_since_lost_list, face_saved
-
-    gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    height, width = frame.shape[:2]
-    current_frame_size = frame.shape[:2]
-
-    if expected_frame_size is None:
-        expected_frame_size = current_frame_size
-    elif current_frame_size != expected_frame_size:
-        trackers.clear()
-        tracking_states.clear()
-        bboxes.clear()
-        frames_since_lost_list.clear()
-        expected_frame_size = current_frame_size
-        return frame
-
-    frame_count += 1
-
-    # Face detection
-    if not any(tracking_states) or frame_count % detection_interval == 0:
-        faces = detector(gray_frame, 1)
-        for face in faces:
-            x1, y1, x2, y2 = face.left(), face.top(), face.right(), face.bottom()
-            new_bbox = (x1, y1, x2 - x1, y2 - y1)
-
-            is_new_face = True
-            for i, existing_bbox in enumerate(bboxes):
-                ex, ey, ew, eh = existing_bbox
-                nx, ny, nw, nh = new_bbox
-                if abs(nx - ex) < 50 and abs(ny - ey) < 50 and abs(nw - ew) < 50 and abs(nh - eh) < 50 and tracking_states[i]:
-                    is_new_face = False
-                    break
-
-            if is_new_face and tracker_algorithm_type is not None:
-                tracker = tracker_algorithm_type()
-                tracker.init(frame, new_bbox)
-                trackers.append(tracker)
-                tracking_states.append(True)
-                bboxes.append(new_bbox)
-                frames_since_lost_list.append(0)
-                frame_count = 0
-
-    # Update trackers
-    updated_trackers, updated_states, updated_bboxes, updated_lost = [], [], [], []
-
-    for i, tracker_obj in enumerate(trackers):
-        success, bbox = tracker_obj.update(frame)
-        if success:
-            x, y, w, h = [int(v) for v in bbox]
-            x, y, w, h = max(0, x), max(0, y), min(w, width - x), min(h, height - y)
-
-            if w > 40 and h > 40 and 0.7 < w / h < 1.3:
-                face_roi = frame[y:y+h, x:x+w]
-                if face_roi.size > 0:
-                    if not face_saved:
-                        filename = os.path.join(output_directory, f"first_face_{cv2.getTickCount()}.png")
-                        cv2.imwrite(filename, face_roi)
-                        face_saved = True
-                    blurred_face = cv2.GaussianBlur(face_roi, (81, 81), 0)
-                    frame[y:y+h, x:x+w] = blurred_face
-                    updated_trackers.append(tracker_obj)
-                    updated_states.append(True)
-                    updated_bboxes.append((x, y, w, h))
-                    updated_lost.append(0)
-                    continue
-        updated_states.append(False)
-        updated_lost.append(frames_since_lost_list[i] + 1)
-
-    trackers[:] = updated_trackers
-    tracking_states[:] = updated_states
-    bboxes[:] = updated_bboxes
-    frames_since_lost_list[:] = updated_lost
-
-    return frame
-
-
-def process_audio_chunk(audio_bytes: bytes, rate: int, channels: int, sample_width: int):
-    global audio_chunk_counter
-    global current_pitch_factor
-
-    audio_array = np.frombuffer(audio_bytes, dtype=np.int16)
-
-    if audio_chunk_counter % change_frequency_factor == 0:
-        if random.random() < change_probability:
-            if random.random() < 0.5:
-                potential_factor = random.uniform(min_pitch_factor_low, max_pitch_factor_low)
-            else:
-                potential_factor = random.uniform(min_pitch_factor_high, max_pitch_factor_high)
-
-            if abs(potential_factor - 1.0) >= min_pitch_change_threshold:
-                current_pitch_factor = round(potential_factor / robotic_factor) * robotic_factor
-
-    pitch_factor = current_pitch_factor
-
-    if pitch_factor > 1.0:
-        new_length = int(len(audio_array) / pitch_factor)
-        if new_length > 0:
-            indices = np.round(np.linspace(0, len(audio_array) - 1, new_length)).astype(int)
-            modulated_audio = audio_array[indices]
-        else:
-            modulated_audio = np.array([], dtype=np.int16)
-    elif pitch_factor < 1.0:
-        repeat_factor = int(1 / pitch_factor)
-        modulated_audio = np.repeat(audio_array, repeat_factor)[:len(audio_array)]
-    else:
-        modulated_audio = audio_array
-
-    max_amplitude = np.iinfo(np.int16).max
-    clip_threshold = int(max_amplitude * (1.0 - distortion_level))
-    modulated_audio = np.clip(modulated_audio, -clip_threshold, clip_threshold)
-
-    audio_chunk_counter += 1
-    return modulated_audio.tobytes()
-
-
-def process_full_audio(audio_bytes: bytes):
-    global audio_chunk_counter, current_pitch_factor
-    audio_chunk_counter = 0
-    current_pitch_factor = 1.0 # Reset for full file
-
-    audio_stream = io.BytesIO(audio_bytes)
-    with wave.open(audio_stream, 'rb') as wf:
-        num_channels = wf.getnchannels()
-        sample_width = wf.getsampwidth()
-        frame_rate = wf.getframerate()
-        original_frames = wf.readframes(wf.getnframes())
-
-    scrambled_frames = b""
-    chunk_size = CHUNK # Use the global CHUNK size
-    for i in range(0, len(original_frames), chunk_size):
-        chunk = original_frames[i:i + chunk_size]
-        if chunk:
-            scrambled_chunk = process_audio_chunk(chunk, frame_rate, num_channels, sample_width)
-            scrambled_frames += scrambled_chunk
-
+FULL_FILE_BLOCK_CHUNKS = 256  # CHUNK-byte pieces read and scrambled per block of a full file
+SCRAMBLED_OUTPUT_PATH = "scrambled_recording.wav"
+
+# Modulation settings live in audio_scrambler; /scramble_chunk callers share one stream,
+# initialized with a random modulating pitch factor
+chunk_scrambler = AudioScrambler(initial_factor=random_pitch_factor())
+
+# --- Live Audio Stream Settings ---
+stream_chunk_ms = 5          # Scrambling granularity; also the send cadence
+stream_fade_ms = 1           # Crossfade between consecutive chunks
+stream_latency_ms = 15       # Jitter buffer target
+stream_max_latency_ms = 60   # Beyond this the oldest buffered audio is dropped
+
+# Detection, tracking and blur settings live in blur_engine
+# Face crops are saved per session by a background writer (see face_snapshots)
+face_snapshots = SnapshotWriter("barry/images/")
+
+# --- Session Settings ---
+DEFAULT_SESSION_ID = "default"
+session_ttl = 30.0        # Seconds a stream may stay idle before its trackers are dropped
+max_sessions = 64         # Least recently used streams are evicted beyond this
+max_live_trackers = 128   # Across all sessions; extra faces stay blurred where detected, re-detected every frame
+
+# --- Box Reply Settings ---
+BOXES_OUTPUT = "boxes"    # output=boxes replies with face boxes for the client to blur itself
+box_tolerance = 2         # Pixels boxes may move and still count as unchanged
+box_padding = 0.15        # Clients pad boxes by this fraction of their size to cover motion since the frame
+UNCHANGED_REPLY = json.dumps({"changed": False}).encode()
+
+
+class TrackingSession:
+    """Blur engine and bookkeeping for a single client stream."""
+
+    def __init__(self, session_id, tracker_budget=None):
+        self.session_id = session_id
+        self.engine = FaceBlurEngine(detector=workers.detect_faces, on_face=face_snapshots.session(session_id),
+                                     tracker_budget=tracker_budget)
+        self.engine.add_timing_hook(metrics.record_blur_stage)
+        self.last_seen = time.monotonic()
+        self.lock = threading.Lock()  # Frames of one session may land on different worker threads
+        self.sent_boxes = None        # Boxes last sent to an output=boxes client
+
+
+class SessionStore:
+    """LRU/TTL-bounded map of session id -> TrackingSession."""
+
+    def __init__(self, ttl, max_sessions, max_trackers):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_trackers = max_trackers
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self.lock:
+            self._evict_idle(now)
+            session = self.sessions.pop(session_id, None)
+            if session is None:
+                session = TrackingSession(session_id, self.has_tracker_capacity)
+            session.last_seen = now
+            self.sessions[session_id] = session
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+            return session
+
+    def remove(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def live_trackers(self):
+        with self.lock:
+            return sum(len(s.engine.tracks) for s in self.sessions.values())
+
+    def has_tracker_capacity(self):
+        return self.live_trackers() < self.max_trackers
+
+    def _evict_idle(self, now):
+        # Sessions are kept in last-used order, so idle ones sit at the front
+        while self.sessions:
+            oldest = next(iter(self.sessions.values()))
+            if now - oldest.last_seen <= self.ttl:
+                break
+            self.sessions.popitem(last=False)
+
+
+sessions = SessionStore(session_ttl, max_sessions, max_live_trackers)
+
+
+# --- Streaming Settings ---
+FRAME_ID_BYTES = 4        # Each WebSocket message starts with a big-endian frame id
+stream_max_pending = 2    # Frames queued per socket before the oldest is dropped
+
+# --- Batch Settings ---
+max_batch_images = 256
+BATCH_MODES = ("stills", "stream")
+# Independent stills need detection only, so one tracker-free engine serves every batch thread
+still_engine = FaceBlurEngine(detector=workers.detect_faces)
+still_engine.add_timing_hook(metrics.record_blur_stage)
+
+
+def getBlurredImage(frame, session=None):
+    if session is None:
+        session = sessions.get(DEFAULT_SESSION_ID)
+    return session.engine.process(frame)
+
+
+def process_audio_chunk(audio_bytes: bytes, rate: int, channels: int, sample_width: int, sample_format=None, planar=False):
+    """Scrambles one chunk of `channels`-channel PCM; raises ValueError if the bytes don't match the format."""
+    sample_format = sample_format or DEFAULT_FORMAT_FOR_WIDTH.get(sample_width)
+    audio_array = decode_samples(audio_bytes, channels, sample_format, planar)
+    scrambled = chunk_scrambler.process_chunk(audio_array, sample_format)
+    return encode_samples(scrambled, sample_format, planar)
+
+
+def scramble_wav_stream(source, destination, seed=None, block_chunks=FULL_FILE_BLOCK_CHUNKS):
+    """Scrambles a WAV file in CHUNK-byte chunks, a block at a time (see audio_scrambler.scramble_wav)."""
+    return scramble_wav(source, destination, CHUNK, seed, block_chunks)
+
+def process_full_audio(audio_bytes: bytes, seed=None):
     output_wav_stream = io.BytesIO()
-    with wave.open(output_wav_stream, 'wb') as out_wf:
-        out_wf.setnchannels(num_channels)
-        out_wf.setsampwidth(sample_width)
-        out_wf.setframerate(frame_rate)
-        out_wf.writeframes(scrambled_frames)
-
-    output_wav_stream.seek(0)
+    num_channels, sample_width, frame_rate = scramble_wav_stream(io.BytesIO(audio_bytes), output_wav_stream, seed)
     return output_wav_stream.getvalue(), num_channels, sample_width, frame_rate
 
+def scramble_wav_file(source, output_path, seed=None):
+    # Write next to the target and swap it in, so readers never see a half-written file; each
+    # call gets its own temp file since several uploads can be scrambled at once
+    directory, name = os.path.split(output_path)
+    fd, partial_path = tempfile.mkstemp(dir=directory or ".", prefix=name + ".", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as partial:
+            scramble_wav_stream(source, partial, seed)
+        os.chmod(partial_path, 0o644)  # mkstemp creates files private to the owner
+        os.replace(partial_path, output_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+def overloaded_response(error):
+    return Response(str(error), status_code=503, headers={"Retry-After": "1"})
+
 @app.post("/scramble_full_file")
-async def scramble_full_wav_file(file: UploadFile = File(...)):
+async def scramble_full_wav_file(file: UploadFile = File(...), seed: Optional[int] = None):
     if file.content_type != "audio/wav":
         return Response("Invalid file type. Only WAV files are supported.", status_code=400)
 
     try:
-        audio_bytes = await file.read()
-        scrambled_audio_data, num_channels, sample_width, frame_rate = process_full_audio(audio_bytes)
-
-        with open("scrambled_recording.wav", 'wb') as outfile:
-            with wave.open(outfile, 'wb') as wf:
-                wf.setnchannels(num_channels)
-                wf.setsampwidth(sample_width)
-                wf.setframerate(frame_rate)
-                wf.writeframes(scrambled_audio_data)
+        # The upload is spooled to disk by Starlette, so the WAV is read incrementally from there
+        await audio_pool.run(scramble_wav_file, file.file, SCRAMBLED_OUTPUT_PATH, seed)
 
-        return Response("Scrambled audio saved to scrambled_recording.wav", status_code=200)
+        return Response(f"Scrambled audio saved to {SCRAMBLED_OUTPUT_PATH}", status_code=200)
 
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         return Response(f"Error processing file: {e}", status_code=500)
 
 @app.post("/scramble_chunk")
-async def scramble_audio_chunk(audio_chunk: bytes = File(...), rate: int = RATE, channels: int = CHANNELS, sample_width: int = 2):
-    scrambled_chunk = process_audio_chunk(audio_chunk, rate, channels, sample_width)
+async def scramble_audio_chunk(audio_chunk: bytes = File(...), rate: int = RATE, channels: int = CHANNELS, sample_width: int = 2,
+                               sample_format: Optional[str] = None, planar: bool = False):
+    """
+    Scrambles one chunk of PCM audio.
+
+    `sample_width` 2, 3 and 4 mean int16, packed int24 and float32 unless `sample_format`
+    (int16, int24, int32, float32) says otherwise. Samples are interleaved unless `planar`.
+    """
+    try:
+        scrambled_chunk = await audio_pool.run(process_audio_chunk, audio_chunk, rate, channels, sample_width,
+                                               sample_format, planar)
+    except Overloaded as e:
+        return overloaded_response(e)
+    except ValueError as e:
+        return Response(str(e), status_code=400)
     return Response(content=scrambled_chunk, media_type="application/octet-stream")
 
+@app.websocket("/scramble_ws")
+async def scramble_stream(
+    websocket: WebSocket,
+    rate: int = RATE,
+    channels: int = CHANNELS,
+    sample_width: int = 2,
+    sample_format: Optional[str] = None,
+    planar: bool = False,
+    latency_ms: int = stream_latency_ms,
+):
+    """
+    Scrambles a live audio stream with its own scrambler state.
+
+    Clients send binary PCM messages of any length (same format options as /scramble_chunk)
+    and receive scrambled PCM in stream_chunk_ms chunks, paced in real time behind a
+    `latency_ms` jitter buffer. Sending the text message "stats" returns the buffer's
+    underrun/overrun counters as JSON.
+    """
+    sample_format = sample_format or DEFAULT_FORMAT_FOR_WIDTH.get(sample_width)
+    if sample_format not in SAMPLE_FORMATS or channels < 1 or rate < 1000:
+        await websocket.close(code=1003)
+        return
+    await websocket.accept()
+
+    chunk_frames = max(1, rate * stream_chunk_ms // 1000)
+    scrambler = StreamScrambler(channels, sample_format, chunk_frames,
+                                fade_frames=max(1, rate * stream_fade_ms // 1000),
+                                initial_factor=random_pitch_factor())
+    jitter = JitterBuffer(channels, scrambler.dtype, latency_frames=rate * max(latency_ms, 0) // 1000,
+                          max_frames=rate * stream_max_latency_ms // 1000)
+    stats_requested = asyncio.Event()
+
+    async def receive_audio():
+        # Chunks take microseconds to scramble, so they run inline instead of hopping to the audio pool
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes"):
+                try:
+                    audio = decode_samples(message["bytes"], channels, sample_format, planar)
+                except ValueError:
+                    continue
+                jitter.push(scrambler.process(audio))
+            elif message.get("text") == "stats":
+                stats_requested.set()
+
+    async def send_audio():
+        loop = asyncio.get_running_loop()
+        period = chunk_frames / rate
+        next_send = loop.time()
+        while True:
+            # Pace against an absolute schedule so sleep overshoot doesn't accumulate
+            next_send += period
+            await asyncio.sleep(max(0.0, next_send - loop.time()))
+            if stats_requested.is_set():
+                stats_requested.clear()
+                await websocket.send_json(jitter.stats())
+            chunk = jitter.pop(chunk_frames)
+            if chunk is not None:
+                await websocket.send_bytes(encode_samples(chunk, sample_format, planar))
+
+    receiver = asyncio.create_task(receive_audio())
+    sender = asyncio.create_task(send_audio())
+    try:
+        await asyncio.wait({receiver, sender}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        receiver.cancel()
+        sender.cancel()
+        for task in (receiver, sender):
+            if task.done() and not task.cancelled():
+                task.exception()  # Disconnect errors are expected here
+
+def decode_frame(codec, content, engine):
+    with engine.timed("decode"):
+        return codec.decode(content)
+
+def encode_frame(codec, frame, engine):
+    with engine.timed("encode"):
+        return codec.encode(frame)
+
+def blur_encoded_frame(content, session, codec=None):
+    """
+    Decodes a frame, blurs it with the session's trackers and re-encodes it.
+
+    Returns (payload, response headers), or None if the frame can't be decoded.
+    """
+    codec = codec or FrameCodec()
+    frame = decode_frame(codec, content, session.engine)
+    if frame is None:
+        return None
+
+    with session.lock:
+        blurred = getBlurredImage(frame, session)
+    return encode_frame(codec, blurred, session.engine), codec.response_headers(blurred)
+
+def same_boxes(a, b):
+    return b is not None and len(a) == len(b) and all(
+        abs(p - q) <= box_tolerance for box_a, box_b in zip(a, b) for p, q in zip(box_a, box_b))
+
+def locate_encoded_frame(content, session, codec=None):
+    """
+    Decodes a frame and runs it through the session's trackers without blurring or
+    re-encoding it. Returns the JSON reply for an output=boxes client, or None if the
+    frame can't be decoded. When the boxes haven't moved since the last reply the
+    answer is just {"changed": false} and the client keeps what it has.
+    """
+    codec = codec or FrameCodec()
+    frame = decode_frame(codec, content, session.engine)
+    if frame is None:
+        return None
+
+    with session.lock:
+        session.engine.process(frame, apply_blur=False)
+        boxes = session.engine.last_boxes
+        if same_boxes(boxes, session.sent_boxes):
+            return UNCHANGED_REPLY
+        session.sent_boxes = boxes
+
+    height, width = frame.shape[:2]
+    recipe = dict(blur_recipe(), padding=box_padding)
+    return json.dumps({"changed": True, "width": width, "height": height,
+                       "boxes": [list(box) for box in boxes], "recipe": recipe}).encode()
+
 @app.post("/blur")
-async def blur_image(file: UploadFile = File(...)):
-    content = await file.read()
-    np_arr = np.frombuffer(content, np.uint8)
-    frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+async def blur_image(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    x_session_id: Optional[str] = Header(None),
+    x_pixel_format: Optional[str] = Header(None),
+    x_frame_width: Optional[int] = Header(None),
+    x_frame_height: Optional[int] = Header(None),
+    accept: Optional[str] = Header(None),
+    output: Optional[str] = None,
+    quality: Optional[int] = None,
+):
+    """
+    Blurs faces in one frame.
+
+    The frame is either a multipart `file` upload or, with an X-Pixel-Format header
+    (bgr, rgb, bgra, rgba), a raw pixel buffer body sized by X-Frame-Width/X-Frame-Height.
+    The reply is JPEG unless `output` (jpeg, webp, raw) or the Accept header asks otherwise;
+    `quality` sets the JPEG/WebP quality. With `output=boxes` the frame isn't blurred: the
+    reply is the face boxes plus a blur recipe as JSON (see locate_encoded_frame), so the
+    client can skip downloading an image.
+    """
+    boxes_only = output == BOXES_OUTPUT
+    try:
+        codec = FrameCodec.negotiate(accept, None if boxes_only else output, pixel_format=x_pixel_format,
+                                     width=x_frame_width, height=x_frame_height, quality=quality)
+    except ValueError as e:
+        return Response(str(e), status_code=400)
 
-    if frame is None:
-        return Response("Invalid image", status_code=400)
+    content = await file.read() if file is not None else await request.body()
+    session = sessions.get(x_session_id or DEFAULT_SESSION_ID)
+    try:
+        result = await blur_pool.run(locate_encoded_frame if boxes_only else blur_encoded_frame, content, session, codec)
+    except Overloaded as e:
+        return overloaded_response(e)
 
-    blurred = getBlurredImage(frame)
-    _, encoded = cv2.imencode(".jpg", blurred)
-    return Response(encoded.tobytes(), media_type="image/jpeg")
+    if result is None:
+        return Response("Invalid image", status_code=400)
+    if boxes_only:
+        return Response(result, media_type="application/json")
+
+    payload, headers = result
+    return Response(payload, media_type=codec.media_type, headers=headers)
+
+@app.websocket("/blur_ws")
+async def blur_stream(
+    websocket: WebSocket,
+    session_id: Optional[str] = None,
+    pixel_format: Optional[str] = None,
+    width: Optional[int] = None,
+    height: Optional[int] = None,
+    output: Optional[str] = None,
+    quality: Optional[int] = None,
+):
+    """
+    Streams frames through the blur pipeline over one socket.
+
+    Clients send binary messages of a 4-byte frame id followed by a frame and may keep
+    several frames in flight. Replies carry the same id followed by the blurred frame.
+    When frames arrive faster than they can be processed the oldest queued ones are
+    dropped, and their id is echoed back with an empty payload so the client can free the slot.
+    Query parameters pick the transport the same way /blur's headers do; with
+    `output=boxes` each reply carries /blur's JSON box reply instead of an image.
+    """
+    boxes_only = output == BOXES_OUTPUT
+    handle_frame = locate_encoded_frame if boxes_only else blur_encoded_frame
+    try:
+        codec = FrameCodec(pixel_format, width, height, None if boxes_only else output, quality)
+    except ValueError:
+        await websocket.close(code=1003)
+        return
+    await websocket.accept()
+    session_id = session_id or uuid.uuid4().hex
+    pending = []
+    dropped = []
+    frame_ready = asyncio.Event()
+
+    async def receive_frames():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            # Text messages have no frame to blur
+            frame = message.get("bytes")
+            if not frame or len(frame) < FRAME_ID_BYTES:
+                continue
+            if len(frame) == FRAME_ID_BYTES:
+                # No payload to blur; answer it like an unreadable frame so the client frees the slot
+                dropped.append(frame)
+                frame_ready.set()
+                continue
+            pending.append(frame)
+            while len(pending) > stream_max_pending:
+                dropped.append(pending.pop(0)[:FRAME_ID_BYTES])
+                metrics.stream_frames_dropped.inc()
+            frame_ready.set()
+
+    async def process_frames():
+        try:
+            while True:
+                await frame_ready.wait()
+                frame_ready.clear()
+                while dropped or pending:
+                    while dropped:
+                        await websocket.send_bytes(dropped.pop(0))
+                    if not pending:
+                        break
+                    message = pending.pop(0)
+                    frame_id = message[:FRAME_ID_BYTES]
+                    session = sessions.get(session_id)
+                    try:
+                        result = await blur_pool.run(handle_frame, message[FRAME_ID_BYTES:], session, codec)
+                    except Overloaded:
+                        result = None  # Reported to the client like any other dropped frame
+                        metrics.stream_frames_dropped.inc()
+                    if result is not None and not boxes_only:
+                        result = result[0]
+                    await websocket.send_bytes(frame_id + (result or b""))
+        except WebSocketDisconnect:
+            pass
+
+    receiver = asyncio.create_task(receive_frames())
+    processor = asyncio.create_task(process_frames())
+    try:
+        await asyncio.wait({receiver, processor}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        receiver.cancel()
+        processor.cancel()
+        sessions.remove(session_id)
+    for task in (receiver, processor):
+        if task.done() and not task.cancelled() and task.exception() is not None:
+            raise task.exception()  # A pipeline failure, not the client going away
+
+def blur_batch(contents, codec, session=None):
+    """
+    Blurs a list of encoded images and returns their encoded results in the same order
+    (None for any that can't be decoded).
+
+    Decoding and encoding fan out over the batch threads. Stills are blurred in parallel
+    from one detection each; with a `session` the images are consecutive frames and go
+    through its tracker in order, so most of them skip detection entirely.
+    """
+    engine = still_engine if session is None else session.engine
+    frames = workers.map_parallel(lambda content: decode_frame(codec, content, engine), contents)
+    if session is None:
+        frames = workers.map_parallel(lambda frame: None if frame is None else still_engine.process_still(frame), frames)
+    else:
+        with session.lock:
+            frames = [None if frame is None else session.engine.process(frame) for frame in frames]
+    return workers.map_parallel(lambda frame: None if frame is None else encode_frame(codec, frame, engine), frames)
+
+def batch_entry_name(index, filename, extension):
+    stem = re.sub(r"[^A-Za-z0-9_.-]", "_", os.path.splitext(os.path.basename(filename or ""))[0]) or "image"
+    return f"{index:04d}_{stem}.{extension}"
+
+def zip_bundle(filenames, payloads, extension):
+    # Images are already compressed; storing them keeps zipping nearly free
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        for index, (filename, payload) in enumerate(zip(filenames, payloads)):
+            if payload is None:
+                archive.writestr(batch_entry_name(index, filename, "error.txt"), "Invalid image")
+            else:
+                archive.writestr(batch_entry_name(index, filename, extension), payload)
+    return buffer.getvalue()
+
+def multipart_bundle(filenames, payloads, extension, media_type, boundary):
+    parts = []
+    for index, (filename, payload) in enumerate(zip(filenames, payloads)):
+        if payload is None:
+            headers = f"Content-Type: text/plain\r\nX-Image-Index: {index}\r\nX-Error: Invalid image\r\n"
+            payload = b"Invalid image"
+        else:
+            name = batch_entry_name(index, filename, extension)
+            headers = (f"Content-Type: {media_type}\r\nContent-Disposition: attachment; filename=\"{name}\"\r\n"
+                       f"X-Image-Index: {index}\r\n")
+        parts.append(f"--{boundary}\r\n{headers}\r\n".encode() + payload + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts)
+
+@app.post("/blur_batch")
+async def blur_image_batch(
+    files: List[UploadFile] = File(...),
+    x_session_id: Optional[str] = Header(None),
+    accept: Optional[str] = Header(None),
+    mode: str = "stills",
+    bundle: Optional[str] = None,
+    output: Optional[str] = None,
+    quality: Optional[int] = None,
+):
+    """
+    Blurs faces in many images with one request.
+
+    `mode=stills` treats the images as unrelated photos; `mode=stream` as consecutive
+    frames, tracked through the X-Session-ID session if given (else a throwaway one).
+    Results come back in upload order as a zip (default) or, with `bundle=multipart` or
+    an Accept of multipart/mixed, as multipart/mixed parts. Unreadable images appear as
+    error entries in their place. `output` and `quality` work as for /blur.
+    """
+    if mode not in BATCH_MODES:
+        return Response(f"Unsupported mode: {mode}", status_code=400)
+    if bundle is None:
+        bundle = "multipart" if accept and "multipart/mixed" in accept else "zip"
+    if bundle not in ("zip", "multipart"):
+        return Response(f"Unsupported bundle: {bundle}", status_code=400)
+    if len(files) > max_batch_images:
+        return Response(f"At most {max_batch_images} images per batch", status_code=413)
+    try:
+        codec = FrameCodec(output_format=output, quality=quality)
+    except ValueError as e:
+        return Response(str(e), status_code=400)
+
+    contents = [await f.read() for f in files]
+    session = None
+    if mode == "stream":
+        session = sessions.get(x_session_id) if x_session_id else TrackingSession(uuid.uuid4().hex, sessions.has_tracker_capacity)
+    try:
+        payloads = await blur_pool.run(blur_batch, contents, codec, session)
+    except Overloaded as e:
+        return overloaded_response(e)
+
+    filenames = [f.filename for f in files]
+    if bundle == "zip":
+        return Response(zip_bundle(filenames, payloads, codec.extension), media_type="application/zip")
+    boundary = uuid.uuid4().hex
+    return Response(multipart_bundle(filenames, payloads, codec.extension, codec.media_type, boundary),
+                    media_type=f"multipart/mixed; boundary={boundary}")
+
+@app.get("/snapshot_stats")
+async def snapshot_stats():
+    """Face snapshot writer counters; `dropped` grows when the disk can't keep up."""
+    return face_snapshots.stats()
+
+@app.get("/tracker_stats")
+async def tracker_stats():
+    """Mean update cost per tracker type, for tuning TRACKER_TYPE and TRACKER_BUDGET_MS."""
+    return cost_report()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Pipeline metrics in the Prometheus text format; gauges are read at scrape time."""
+    pools = (blur_pool, audio_pool)
+    tracker_costs = cost_totals()
+    snapshots = face_snapshots.stats()
+    gauges = (
+        metrics.sample_lines("pool_pending", "Jobs queued or running per worker pool.", "gauge",
+                             {pool.name: pool.pending for pool in pools}, "pool")
+        + metrics.sample_lines("pool_rejected_total", "Jobs turned away because the pool was full.", "counter",
+                               {pool.name: pool.rejected for pool in pools}, "pool")
+        + metrics.sample_lines("tracking_sessions", "Client streams with live tracking state.", "gauge",
+                               {None: len(sessions.sessions)})
+        + metrics.sample_lines("live_trackers", "Face trackers across all sessions.", "gauge",
+                               {None: sessions.live_trackers()})
+        + metrics.sample_lines("tracker_updates_total", "Tracker updates per tracker type.", "counter",
+                               {name: count for name, (count, _) in tracker_costs.items()}, "type")
+        + metrics.sample_lines("tracker_update_seconds_total", "Time spent in tracker updates per tracker type.",
+                               "counter", {name: seconds for name, (_, seconds) in tracker_costs.items()}, "type")
+        + metrics.sample_lines("snapshot_queue_depth", "Face snapshots waiting to be written.", "gauge",
+                               {None: snapshots["queued"]})
+        + metrics.sample_lines("snapshots_total", "Face snapshots by outcome.", "counter",
+                               {outcome: snapshots[outcome] for outcome in ("written", "dropped", "failed")}, "outcome")
+    )
+    return Response(metrics.render(gauges), media_type=metrics.CONTENT_TYPE)
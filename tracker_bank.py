@@ -0,0 +1,186 @@
+import time
+import numpy as np
+from detection_scheduler import confident_iou
+from tracker_registry import record_cost
+
+# --- Track Settings ---
+min_tracked_size = 40           # Tracked boxes this small, or far from square, count as lost
+velocity_smoothing = 0.5        # Weight of the newest motion in each track's velocity estimate
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """Pairwise intersection-over-union of (x, y, w, h) boxes, shaped (len(boxes_a), len(boxes_b))."""
+    a = np.asarray(boxes_a, dtype=float).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=float).reshape(-1, 4)
+    inter_w = np.minimum(a[:, None, 0] + a[:, None, 2], b[None, :, 0] + b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0])
+    inter_h = np.minimum(a[:, None, 1] + a[:, None, 3], b[None, :, 1] + b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1])
+    intersection = np.clip(inter_w, 0, None) * np.clip(inter_h, 0, None)
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def greedy_match(scores, threshold):
+    """Pairs rows with columns by descending score, each at most once; returns [(row, col)] above `threshold`."""
+    if scores.size == 0:
+        return []
+    order = np.argsort(scores, axis=None)[::-1]
+    rows, cols = np.unravel_index(order, scores.shape)
+    above = scores[rows, cols] >= threshold
+    pairs, used_rows, used_cols = [], set(), set()
+    for row, col in zip(rows[above].tolist(), cols[above].tolist()):
+        if row in used_rows or col in used_cols:
+            continue
+        used_rows.add(row)
+        used_cols.add(col)
+        pairs.append((row, col))
+    return pairs
+
+
+def plausible_face(bbox):
+    x, y, w, h = bbox
+    return w > min_tracked_size and h > min_tracked_size and 0.7 < w / h < 1.3
+
+
+class Track:
+    """One followed face: its tracker, last box, id and motion estimate."""
+
+    def __init__(self, track_id, tracker, kind, bbox):
+        self.track_id = track_id
+        self.tracker = tracker
+        self.kind = kind        # Tracker type name, for cost accounting
+        self.bbox = bbox
+        self.velocity = (0.0, 0.0)
+        self.lost_frames = 0    # Frames since the tracker last reported the face
+
+
+class TrackerBank:
+    """
+    The set of faces followed in one stream.
+
+    Detections are associated with tracks by IoU in one vectorized pass. A track whose
+    tracker loses the face coasts on its last velocity for up to `grace_period` frames,
+    so the face stays blurred, and is re-initialized in place (keeping its id) when a
+    detection overlaps it again. Matched tracks that overlap their detection less than
+    `confident_iou` are re-seeded from it too, so a drifting tracker is pulled back onto
+    the face. A track is never dropped because detection missed it (detectors miss turned
+    heads that trackers still follow), only when its coast runs out. At most `max_tracks`
+    tracks exist at once.
+
+    Detections the bank can't track (bank full, `can_add()` refused, or no tracker type)
+    are kept in `untracked` and stay blurred at their detected position until the next
+    detection pass replaces them; the scheduler detects every frame while there are any.
+
+    `confidence` is the worst overlap between a followed track and its detection in the
+    last detection pass (0 if a track had none), a measure of how far trackers drift.
+
+    Every tracker update is timed; `update_seconds` is the last frame's total. A factory
+    with an `adapt(update_seconds)` method (a TrackerLadder) may ask for every tracker to
+    be replaced with a cheaper type, which happens in place on the same frame.
+    """
+
+    def __init__(self, tracker_factory, max_tracks, grace_period, match_iou):
+        self.tracker_factory = tracker_factory
+        self.max_tracks = max_tracks
+        self.grace_period = grace_period
+        self.match_iou = match_iou
+        self.tracks = []
+        self.next_track_id = 0
+        self.confidence = 1.0
+        self.update_seconds = 0.0
+        self.untracked = []     # (x, y, w, h) faces from the last detection pass without a tracker
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def clear(self):
+        self.tracks.clear()
+        self.untracked = []
+
+    def has_lost_tracks(self):
+        return any(track.lost_frames for track in self.tracks)
+
+    def add_detections(self, frame, boxes, can_add=None):
+        """
+        Matches (x, y, w, h) detections against the tracks, re-seeds lost or drifting
+        tracks and starts new ones. Returns the detections left without a tracker, which
+        also become `untracked`.
+        """
+        scores = iou_matrix([t.bbox for t in self.tracks], boxes)
+        matches = greedy_match(scores, self.match_iou)
+        overlaps = [0.0] * len(self.tracks)
+        matched = set()
+        for track_index, box_index in matches:
+            matched.add(box_index)
+            overlaps[track_index] = float(scores[track_index, box_index])
+            track = self.tracks[track_index]
+            if track.lost_frames or overlaps[track_index] < confident_iou:
+                self._start_tracker(track, frame, boxes[box_index])
+                track.lost_frames = 0
+        self.confidence = min(overlaps, default=1.0)
+
+        untracked = []
+        for box_index, bbox in enumerate(boxes):
+            if box_index in matched:
+                continue
+            if (self.tracker_factory is None or len(self.tracks) >= self.max_tracks
+                    or (can_add is not None and not can_add())):
+                untracked.append(bbox)
+                continue
+            track = Track(self.next_track_id, None, None, bbox)
+            self._start_tracker(track, frame, bbox)
+            self.tracks.append(track)
+            self.next_track_id += 1
+        self.untracked = untracked
+        return untracked
+
+    def _start_tracker(self, track, frame, bbox):
+        track.tracker = self.tracker_factory()
+        track.kind = getattr(self.tracker_factory, "name", type(track.tracker).__name__)
+        track.tracker.init(frame, tuple(int(v) for v in bbox))
+        track.bbox = bbox
+
+    def update(self, frame, clip):
+        """
+        Advances every track by one frame and returns the visible (bbox, track_id) pairs,
+        coasting ones included. `clip(bbox)` keeps boxes inside the frame.
+        """
+        visible, kept = [], []
+        total_seconds = 0.0
+        for track in self.tracks:
+            x, y, w, h = track.bbox
+            if not track.lost_frames:
+                start = time.perf_counter()
+                success, bbox = track.tracker.update(frame)
+                seconds = time.perf_counter() - start
+                record_cost(track.kind, seconds)
+                total_seconds += seconds
+                bbox = clip(bbox) if success else None
+                if bbox is not None and plausible_face(bbox):
+                    dx, dy = bbox[0] - x, bbox[1] - y
+                    vx, vy = track.velocity
+                    track.velocity = (vx + velocity_smoothing * (dx - vx), vy + velocity_smoothing * (dy - vy))
+                    track.bbox = bbox
+                    kept.append(track)
+                    visible.append((bbox, track.track_id))
+                    continue
+
+            # Lost: predict where the face went and keep blurring there for a while
+            track.lost_frames += 1
+            if track.lost_frames > self.grace_period:
+                continue
+            vx, vy = track.velocity
+            bbox = clip((x + vx, y + vy, w, h))
+            if bbox[2] <= 0 or bbox[3] <= 0:
+                continue
+            track.bbox = bbox
+            kept.append(track)
+            visible.append((bbox, track.track_id))
+        self.tracks[:] = kept
+        self.update_seconds = total_seconds
+
+        adapt = getattr(self.tracker_factory, "adapt", None)
+        if adapt is not None and adapt(total_seconds):
+            for track in self.tracks:
+                if not track.lost_frames:
+                    self._start_tracker(track, frame, track.bbox)
+        return visible
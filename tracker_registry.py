@@ -0,0 +1,176 @@
+import os
+import threading
+import cv2
+import numpy as np
+
+# --- Tracker Settings (override with environment variables) ---
+tracker_type = os.environ.get("TRACKER_TYPE", "CSRT")                       # Preferred (most accurate) type
+tracker_time_budget = float(os.environ.get("TRACKER_BUDGET_MS", 20)) / 1000  # Per frame, all of one stream's trackers
+TRACKER_LADDER = ["CSRT", "KCF", "MOSSE", "FLOW"]                            # Most accurate to cheapest
+upgrade_after_frames = 150      # Frames well under budget before stepping back up
+downgrade_after_frames = 5      # Frames the smoothed update time must stay over budget before stepping down
+cost_smoothing = 0.3            # Weight of the newest frame in the smoothed update time
+flow_points = 30                # Corners followed by the FLOW tracker
+flow_margin = 0.25              # Search area around the box, as a fraction of its size
+
+_costs = {}
+_costs_lock = threading.Lock()
+
+
+def resolve_tracker(name=tracker_type):
+    """
+    Returns a constructor for a tracker type, or None if this OpenCV build lacks it.
+
+    Looks for `cv2.Tracker<name>_create`, `cv2.Tracker<name>.create` and the same under
+    `cv2.legacy`, where opencv-contrib 4.5+ moved MOSSE, Boosting, MedianFlow and TLD.
+    "FLOW" is the built-in optical-flow box propagator.
+    """
+    if name == "FLOW":
+        return FlowTracker
+    for module in (cv2, getattr(cv2, "legacy", None)):
+        if module is None:
+            continue
+        create = getattr(module, f"Tracker{name}_create", None)
+        if create is not None:
+            return create
+        tracker_class = getattr(module, f"Tracker{name}", None)
+        if tracker_class is not None and hasattr(tracker_class, "create"):
+            return tracker_class.create
+    return None
+
+
+def record_cost(name, seconds):
+    with _costs_lock:
+        entry = _costs.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+
+def cost_report():
+    """Mean update cost per tracker type across every stream so far."""
+    return {name: {"updates": count, "mean_ms": round(total / count * 1000, 3)}
+            for name, (count, total) in cost_totals().items()}
+
+
+def cost_totals():
+    """(updates, seconds) per tracker type across every stream so far."""
+    with _costs_lock:
+        return {name: tuple(entry) for name, entry in _costs.items()}
+
+
+class FlowTracker:
+    """
+    Cheapest tracker: moves the box by the median Lucas-Kanade flow of corners inside it.
+
+    Only a patch around the box is converted and searched, so cost follows the face size
+    rather than the frame size. It has no appearance model and drifts on long occlusions;
+    TrackerBank re-seeds it from the next detection that overlaps it less than
+    `confident_iou`.
+    """
+
+    def init(self, frame, bbox):
+        self.bbox = tuple(float(v) for v in bbox)
+        self._capture(frame)
+        return True
+
+    def update(self, frame):
+        x1, y1, x2, y2 = self.window
+        previous = self.patch
+        current = _gray(frame[y1:y2, x1:x2])
+        if previous.size == 0 or current.shape != previous.shape:
+            return False, self.bbox
+
+        x, y, w, h = self.bbox
+        mask = np.zeros_like(previous)
+        mask[max(0, int(y) - y1):max(0, int(y + h) - y1), max(0, int(x) - x1):max(0, int(x + w) - x1)] = 255
+        points = cv2.goodFeaturesToTrack(previous, flow_points, 0.01, 5, mask=mask)
+        if points is None:
+            return False, self.bbox
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(previous, current, points, None, winSize=(15, 15), maxLevel=2)
+        found = status.ravel() == 1
+        if found.sum() < 3:
+            return False, self.bbox
+
+        dx, dy = np.median((moved - points).reshape(-1, 2)[found], axis=0)
+        self.bbox = (x + float(dx), y + float(dy), w, h)
+        self._capture(frame)
+        return True, tuple(int(round(v)) for v in self.bbox)
+
+    def _capture(self, frame):
+        height, width = frame.shape[:2]
+        x, y, w, h = self.bbox
+        self.window = (max(0, int(x - w * flow_margin)), max(0, int(y - h * flow_margin)),
+                       min(width, int(x + w * (1 + flow_margin))), min(height, int(y + h * (1 + flow_margin))))
+        x1, y1, x2, y2 = self.window
+        self.patch = _gray(frame[y1:y2, x1:x2])
+
+
+def _gray(patch):
+    return cv2.cvtColor(patch, cv2.COLOR_BGR2GRAY) if patch.ndim == 3 and patch.size else patch
+
+
+class TrackerLadder:
+    """
+    Tracker factory for one stream that trades accuracy for speed under load.
+
+    Starts at `preferred` and, whenever a frame's tracker updates together take longer
+    than `budget` seconds on average for `downgrade_after_frames` frames in a row (more
+    faces, bigger frames; not one slow frame), steps one rung down TRACKER_LADDER. The
+    bank then re-initializes its trackers at the cheaper type. After `upgrade_after_frames`
+    frames at under a quarter of the budget it steps back up for new trackers.
+    Types this OpenCV build lacks are skipped.
+    """
+
+    def __init__(self, preferred=tracker_type, budget=tracker_time_budget):
+        if preferred in TRACKER_LADDER:
+            names = TRACKER_LADDER[TRACKER_LADDER.index(preferred):]
+        else:
+            names = [preferred, "FLOW"]
+        self.levels = [(name, create) for name, create in ((n, resolve_tracker(n)) for n in names) if create is not None]
+        self.level = 0
+        self.budget = budget
+        self.frames_under_budget = 0
+        self.frames_over_budget = 0
+        self.recent_seconds = None
+
+    def __bool__(self):
+        return bool(self.levels)
+
+    @property
+    def name(self):
+        return self.levels[self.level][0]
+
+    def __call__(self):
+        return self.levels[self.level][1]()
+
+    def adapt(self, update_seconds):
+        """Records one frame's total update time; returns True if existing trackers should be replaced."""
+        if self.budget is None:
+            return False
+        if self.recent_seconds is None:
+            # Trackers' first update includes their setup, so start averaging on the next frame
+            self.recent_seconds = 0.0
+            return False
+        if self.recent_seconds == 0.0:
+            self.recent_seconds = update_seconds
+        else:
+            self.recent_seconds += cost_smoothing * (update_seconds - self.recent_seconds)
+
+        if self.recent_seconds > self.budget:
+            self.frames_under_budget = 0
+            self.frames_over_budget += 1
+            if self.frames_over_budget < downgrade_after_frames or self.level == len(self.levels) - 1:
+                return False
+            self.level += 1
+            self.frames_over_budget = 0
+            self.recent_seconds = None
+            return True
+        self.frames_over_budget = 0
+        if self.recent_seconds < self.budget / 4 and self.level > 0:
+            self.frames_under_budget += 1
+            if self.frames_under_budget >= upgrade_after_frames:
+                self.level -= 1
+                self.frames_under_budget = 0
+        else:
+            self.frames_under_budget = 0
+        return False
@@ -1,86 +1,221 @@
+import struct
 import wave
 import numpy as np
 import matplotlib.pyplot as plt
 
-def load_audio_data(file_path):
-    """Loads audio data from a WAV file and returns time and amplitude."""
+# --- Plot Settings ---
+plot_width = 1400           # Pixel columns per plot; waveforms get one min/max pair per column
+figure_dpi = 100
+fft_size = 1024             # Samples per STFT window
+fft_hop = fft_size // 2     # Samples between STFT windows
+chunk_frames = 1 << 20      # Samples read from the memory map at a time
+
+PCM, IEEE_FLOAT, EXTENSIBLE = 1, 3, 0xFFFE
+
+
+class WavReader:
+    """
+    A WAV file memory-mapped rather than read: only the samples a plot asks for are
+    paged in, so memory follows the output resolution instead of the file size.
+
+    Handles 8/16/24/32-bit PCM and 32-bit float; `read` returns the first channel as
+    float32 in [-1, 1].
+    """
+
+    def __init__(self, file_path):
+        self.path = file_path
+        format_tag, self.channels, self.rate, bits, offset, size = _wav_layout(file_path)
+        self.width = bits // 8
+        block_align = self.width * self.channels
+        if format_tag == IEEE_FLOAT and self.width == 4:
+            self.dtype = np.dtype("<f4")
+        elif format_tag == PCM and self.width in (1, 2, 3, 4):
+            self.dtype = {1: np.dtype("u1"), 2: np.dtype("<i2"), 3: None, 4: np.dtype("<i4")}[self.width]
+        else:
+            raise wave.Error(f"Unsupported sample format: tag {format_tag}, {bits} bits")
+
+        self.frames = size // block_align
+        self.raw = np.memmap(file_path, np.uint8, mode="r", offset=offset, shape=(self.frames, block_align))
+
+    @property
+    def duration(self):
+        return self.frames / self.rate
+
+    def read(self, start, stop):
+        """First-channel samples [start, stop) as float32 in [-1, 1]."""
+        data = np.ascontiguousarray(self.raw[start:stop, :self.width])
+        if self.width == 3:
+            padded = np.zeros((len(data), 4), np.uint8)
+            padded[:, 1:] = data
+            return (padded.view("<i4").ravel() >> 8).astype(np.float32) / 2 ** 23
+        samples = data.view(self.dtype).ravel()
+        if self.dtype.kind == "f":
+            return samples
+        if self.dtype.kind == "u":
+            return (samples.astype(np.float32) - 128) / 128
+        return samples.astype(np.float32) / 2 ** (8 * self.width - 1)
+
+    def envelope(self, stop, columns=plot_width):
+        """
+        Min and max of [0, stop) in `columns` equal spans, read a chunk of whole spans
+        at a time. Returns (span centers in seconds, minimums, maximums), empty if stop is 0.
+        """
+        if stop <= 0:
+            return np.empty(0), np.empty(0, np.float32), np.empty(0, np.float32)
+        columns = max(1, min(columns, stop))
+        edges = np.linspace(0, stop, columns + 1).astype(np.int64)
+        lows = np.empty(columns, np.float32)
+        highs = np.empty(columns, np.float32)
+        column = 0
+        while column < columns:
+            last = int(np.searchsorted(edges, edges[column] + chunk_frames, side="right")) - 1
+            last = min(columns, max(column + 1, last))
+            samples = self.read(edges[column], edges[last])
+            offsets = edges[column:last] - edges[column]
+            lows[column:last] = np.minimum.reduceat(samples, offsets)
+            highs[column:last] = np.maximum.reduceat(samples, offsets)
+            column = last
+        return (edges[:-1] + edges[1:]) / 2 / self.rate, lows, highs
+
+    def spectrogram(self, stop, columns=plot_width, size=fft_size, hop=fft_hop):
+        """
+        Power in dB of [0, stop), shape (size // 2 + 1, columns).
+
+        Computes the full STFT (Hann windows `hop` samples apart) a chunk of samples at a
+        time and averages every window into its column, so memory follows the output
+        width while no stretch of the signal is skipped.
+        """
+        count = (stop - size) // hop + 1 if stop > size else 1
+        columns = max(1, min(columns, count))
+        window = np.hanning(size).astype(np.float32)
+        power = np.zeros((columns, size // 2 + 1), np.float64)
+        batch = max(1, chunk_frames // size)
+        for first in range(0, count, batch):
+            last = min(count, first + batch)
+            length = (last - first - 1) * hop + size
+            samples = self.read(first * hop, min(stop, first * hop + length))
+            if len(samples) < length:
+                samples = np.pad(samples, (0, length - len(samples)))
+            segments = np.lib.stride_tricks.sliding_window_view(samples, size)[::hop]
+            spectra = np.abs(np.fft.rfft(segments * window, axis=1)) ** 2
+            # Windows are spread evenly over the columns; each column gets a run of them
+            targets = np.arange(first, last) * columns // count
+            starts = np.flatnonzero(np.diff(targets, prepend=-1))
+            power[targets[starts]] += np.add.reduceat(spectra, starts)
+        power /= np.bincount(np.arange(count) * columns // count, minlength=columns)[:, None]
+        return 10 * np.log10(power.T + 1e-12)
+
+
+def _wav_layout(file_path):
+    """Walks the RIFF chunks; returns (format tag, channels, rate, bits, data offset, data size)."""
+    with open(file_path, "rb") as f:
+        riff, _, wave_id = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave_id != b"WAVE":
+            raise wave.Error("file does not start with RIFF id")
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise wave.Error("data chunk missing")
+            chunk_id, size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                body = f.read(size + (size & 1))
+                format_tag, channels, rate, _, _, bits = struct.unpack("<HHIIHH", body[:16])
+                if format_tag == EXTENSIBLE and len(body) >= 26:
+                    format_tag = struct.unpack("<H", body[24:26])[0]
+                fmt = (format_tag, channels, rate, bits)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise wave.Error("fmt chunk missing")
+                offset = f.tell()
+                # Recorders that were cut off can leave a size larger than the file
+                size = min(size, f.seek(0, 2) - offset)
+                return fmt + (offset, size)
+            else:
+                f.seek(size + (size & 1), 1)
+
+
+def open_audio(file_path):
+    """Memory-maps a WAV file, or returns None (with a message) if it can't be read."""
     try:
-        with wave.open(file_path, 'rb') as wf:
-            frame_rate = wf.getframerate()
-            num_frames = wf.getnframes()
-            audio_data = wf.readframes(num_frames)
-            num_channels = wf.getnchannels()
-            sample_width = wf.getsampwidth()
-
-            # Convert audio data to numerical array (assuming 16-bit PCM)
-            audio_array = np.frombuffer(audio_data, dtype=np.int16)
-
-            # If stereo, take only one channel (e.g., the first one)
-            if num_channels == 2:
-                audio_array = audio_array[::2]
-
-            time = np.linspace(0, len(audio_array) / frame_rate, num=len(audio_array))
-            return time, audio_array, frame_rate
+        return WavReader(file_path)
     except FileNotFoundError:
         print(f"Error: File not found at {file_path}")
-        return None, None, None
-    except wave.Error as e:
+        return None
+    except (wave.Error, struct.error) as e:
         print(f"Error opening or reading WAV file {file_path}: {e}")
-        return None, None, None
+        return None
 
-def visualize_waveforms_with_overlay(file_path1, file_path2):
+
+def visualize_waveforms_with_overlay(file_path1, file_path2, output_path=None):
     """
-    Visualizes the waveforms of two audio files and overlays the first on the second (red).
+    Visualizes the waveforms of two audio files and overlays the first on the second (red),
+    with a spectrogram of each underneath.
 
     Args:
         file_path1 (str): Path to the first WAV file.
         file_path2 (str): Path to the second WAV file (will be red).
+        output_path (str): Save the figure here instead of showing it.
     """
-    time1, audio_array1, rate1 = load_audio_data(file_path1)
-    time2, audio_array2, rate2 = load_audio_data(file_path2)
+    audio1 = open_audio(file_path1)
+    audio2 = open_audio(file_path2)
 
-    if time1 is None or time2 is None:
+    if audio1 is None or audio2 is None:
         return
 
-    if rate1 != rate2:
+    if audio1.rate != audio2.rate:
         print("Warning: Frame rates of the two audio files are different. The time axes might not align perfectly.")
 
-    # Ensure both audio arrays have the same length for overlay
-    min_len = min(len(audio_array1), len(audio_array2))
-    audio_array1 = audio_array1[:min_len]
-    audio_array2 = audio_array2[:min_len]
-    time = time1[:min_len] # Use time from the first file, assuming similar rates
+    # Compare the same stretch of time from both files
+    duration = min(audio1.duration, audio2.duration)
+    stop1 = int(duration * audio1.rate)
+    stop2 = int(duration * audio2.rate)
+    time1, low1, high1 = audio1.envelope(stop1)
+    time2, low2, high2 = audio2.envelope(stop2)
 
     # --- Plot the waveforms ---
-    plt.figure(figsize=(14, 8))
+    plt.figure(figsize=(plot_width / figure_dpi, 10), dpi=figure_dpi)
 
-    plt.subplot(3, 1, 1)
-    plt.plot(time, audio_array1)
+    plt.subplot(4, 1, 1)
+    plt.fill_between(time1, low1, high1, linewidth=0.5)
     plt.title(f'Waveform of {file_path1}')
     plt.xlabel('Time (s)')
     plt.ylabel('Amplitude')
     plt.grid(True)
 
-    plt.subplot(3, 1, 2)
-    plt.plot(time, audio_array2, color='red')
+    plt.subplot(4, 1, 2)
+    plt.fill_between(time2, low2, high2, color='red', linewidth=0.5)
     plt.title(f'Waveform of {file_path2} (Red)')
     plt.xlabel('Time (s)')
     plt.ylabel('Amplitude')
     plt.grid(True)
 
-    plt.subplot(3, 1, 3)
-    plt.plot(time, audio_array1, label=file_path1)
-    plt.plot(time, audio_array2, color='red', label=f'{file_path2} (Red)')
+    plt.subplot(4, 1, 3)
+    plt.fill_between(time1, low1, high1, linewidth=0.5, label=file_path1)
+    plt.fill_between(time2, low2, high2, color='red', alpha=0.5, linewidth=0.5, label=f'{file_path2} (Red)')
     plt.title('Overlay of Waveforms')
     plt.xlabel('Time (s)')
     plt.ylabel('Amplitude')
     plt.grid(True)
     plt.legend()
 
+    # --- Plot the spectrograms, half the width each ---
+    for position, audio, stop, path in ((7, audio1, stop1, file_path1), (8, audio2, stop2, file_path2)):
+        plt.subplot(4, 2, position)
+        plt.imshow(audio.spectrogram(stop, plot_width // 2), origin='lower', aspect='auto', cmap='magma',
+                   extent=(0, duration, 0, audio.rate / 2))
+        plt.title(f'Spectrogram of {path}')
+        plt.xlabel('Time (s)')
+        plt.ylabel('Frequency (Hz)')
+
     plt.tight_layout()
-    plt.show()
+    if output_path:
+        plt.savefig(output_path)
+        plt.close()
+    else:
+        plt.show()
 
 if __name__ == "__main__":
     file1 = "voice_recording.wav"  # Replace with the path to your first audio file
     file2 = "scrambled_recording.wav"  # Replace with the path to your second audio file
-    visualize_waveforms_with_overlay(file1, file2)
\ No newline at end of file
+    visualize_waveforms_with_overlay(file1, file2)
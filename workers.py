@@ -0,0 +1,115 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from metrics import pool_run_seconds, pool_wait_seconds
+
+# --- Worker Settings (override with environment variables) ---
+blur_workers = int(os.environ.get("BLUR_WORKERS", os.cpu_count() or 2))
+blur_queue_depth = int(os.environ.get("BLUR_QUEUE_DEPTH", blur_workers * 2))
+audio_workers = int(os.environ.get("AUDIO_WORKERS", 2))
+audio_queue_depth = int(os.environ.get("AUDIO_QUEUE_DEPTH", 64))
+batch_workers = int(os.environ.get("BATCH_WORKERS", blur_workers))
+detect_processes = int(os.environ.get("DETECT_PROCESSES", 0))  # 0 runs the detector in the blur thread
+
+
+class Overloaded(Exception):
+    """Raised when a pool already has as many jobs as it is allowed to queue."""
+
+
+class BoundedExecutor:
+    """
+    Runs blocking functions on an executor without stalling the event loop.
+
+    At most `max_pending` jobs may be queued or running at once; beyond that `run`
+    raises Overloaded straight away so callers can shed load instead of piling up latency.
+    Each job's time in the queue and on a thread is recorded in the pool metrics.
+    """
+
+    def __init__(self, name, executor, max_pending):
+        self.name = name
+        self.executor = executor
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    async def run(self, func, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise Overloaded(f"{self.name} pool is full ({self.max_pending} jobs)")
+            self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self._timed, time.perf_counter(), func, args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def _timed(self, submitted, func, args):
+        started = time.perf_counter()
+        pool_wait_seconds.observe(started - submitted, self.name)
+        try:
+            return func(*args)
+        finally:
+            pool_run_seconds.observe(time.perf_counter() - started, self.name)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# OpenCV and NumPy release the GIL, so threads are enough for blur and audio work.
+# Audio gets its own pool so chunk latency doesn't queue behind heavy blur traffic.
+blur_pool = BoundedExecutor("blur", ThreadPoolExecutor(blur_workers, thread_name_prefix="blur"), blur_queue_depth)
+audio_pool = BoundedExecutor("audio", ThreadPoolExecutor(audio_workers, thread_name_prefix="audio"), audio_queue_depth)
+# Fan-out for the images of one batch job. The job already holds a blur_pool slot, so this
+# pool is unbounded and separate (a job waiting on its own pool's threads could deadlock).
+batch_executor = ThreadPoolExecutor(batch_workers, thread_name_prefix="batch")
+
+# --- Optional process pool for face detection ---
+detect_pool = ProcessPoolExecutor(detect_processes) if detect_processes > 0 else None
+
+
+def _detect_in_process(gray_frame):
+    import blur_engine
+    return blur_engine.default_detector()(gray_frame)
+
+
+def detect_faces(gray_frame):
+    """Returns (x1, y1, x2, y2) face boxes, using the detection process pool when configured."""
+    if detect_pool is not None:
+        return detect_pool.submit(_detect_in_process, gray_frame).result()
+    return _detect_in_process(gray_frame)
+
+
+def _min_face_window_in_process():
+    import blur_engine
+    from face_detectors import min_face_window
+    return min_face_window(blur_engine.default_detector())
+
+
+@functools.lru_cache(maxsize=None)
+def _detector_min_face_window():
+    # Asked of the process that detects, since a model it can't load there falls back to dlib
+    if detect_pool is not None:
+        return detect_pool.submit(_min_face_window_in_process).result()
+    return _min_face_window_in_process()
+
+
+detect_faces.min_face_window = _detector_min_face_window
+
+
+def map_parallel(func, items):
+    """Applies `func` to every item on the batch threads; results keep the order of `items`."""
+    return list(batch_executor.map(func, items))
+
+
+def shutdown():
+    blur_pool.shutdown()
+    audio_pool.shutdown()
+    batch_executor.shutdown(wait=False, cancel_futures=True)
+    if detect_pool is not None:
+        detect_pool.shutdown(wait=False, cancel_futures=True)